@@ -0,0 +1,110 @@
+import json
+import os
+from collections import Counter, namedtuple
+
+from charClassifier import is_hanzi
+from lruCache import LruCache
+from pinyinResolver import default_pinyin
+
+ANNOTATION_CACHE_FILE = "res/annotation_cache.json"
+
+Annotation = namedtuple("Annotation", ["pinyin", "gloss", "full_gloss"])
+
+
+def truncate_gloss(full_gloss):
+    """Shortens a dictionary translation for display in the live interpretation"""
+    return (full_gloss[1:40] + '...') if len(full_gloss) > 75 else full_gloss[1:]
+
+
+def most_frequent_hanzi(words, count):
+    """Returns the count hanzi which occur in the most dictionary headwords, as a proxy for their frequency in text"""
+    counter = Counter()
+    for word in words:
+        counter.update(hanzi for hanzi in word if is_hanzi(hanzi))
+    return [hanzi for hanzi, _ in counter.most_common(count)]
+
+
+class AnnotationCache:
+    """
+    Bounded LRU cache of annotations (pinyin, truncated gloss and full gloss) per character or word, shared by the
+    live interpretation, the archive and the PDF creator. The cache is thread safe, as the live interpretation
+    annotates in a worker thread. With a PinyinResolver, words are read as in the dictionary, so polyphones get the
+    reading of their context; otherwise every character gets its most common reading.
+    """
+
+    def __init__(self, dictionary=None, capacity=20000, resolver=None):
+        """
+        Parameters
+        ----------
+        dictionary : Dict, optional
+            Used for the glosses. Without a dictionary, only the pinyin is meaningful (e.g. for the PDF creator)
+        capacity : int, optional
+            Maximum number of cached annotations (default is 20000)
+        resolver : PinyinResolver, optional
+            Resolves the reading of polyphones within dictionary words
+        """
+        self.dictionary = dictionary
+        self.resolver = resolver
+        self.cache = LruCache(capacity)
+
+    def get(self, hanzi):
+        """Returns the Annotation for a character or word"""
+        return self.cache.get(hanzi, self.annotate)
+
+    def pinyin(self, hanzi):
+        return self.get(hanzi).pinyin
+
+    def text_pinyins(self, words):
+        """Returns the pinyin of every character of a text split into words (e.g. by the Segmenter), each character
+        read in the context of its word. Characters other than hanzi are kept as they are."""
+        pinyins = []
+        for word in words:
+            readings = self.resolver.word_readings(word) if self.resolver else None
+            pinyins.extend(readings if readings else (self.pinyin(char) for char in word))
+        return pinyins
+
+    def annotate(self, hanzi):
+        """Computes the annotation of a character or word, bypassing the cache"""
+        full_gloss = self.dictionary.translate(hanzi) if self.dictionary else "_"
+        readings = self.resolver.word_readings(hanzi) if self.resolver else None
+        pinyin = "".join(readings) if readings else default_pinyin(hanzi)
+        return Annotation(pinyin, truncate_gloss(full_gloss), full_gloss)
+
+    def warm(self, count=3000):
+        """Pre-computes the annotations of the count most frequent hanzi"""
+        if self.dictionary is None:
+            return
+        for hanzi in most_frequent_hanzi(self.dictionary.words, count):
+            if hanzi not in self.cache:
+                self.cache.put(hanzi, self.annotate(hanzi))
+
+    def load(self, path=ANNOTATION_CACHE_FILE, dictionary_index=None):
+        """Loads annotations persisted by a previous session. The file is ignored if the dictionary index it was
+        built from is newer, and not loaded at all if any of its entries does not fit the current Annotation (e.g.
+        one saved by an older version). Returns True if the file was loaded."""
+        try:
+            if dictionary_index and os.path.getmtime(path) < os.path.getmtime(dictionary_index):
+                return False
+            with open(path, "r", encoding="utf8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, PermissionError, ValueError):
+            return False
+        try:
+            annotations = [(hanzi, Annotation(*annotation)) for hanzi, annotation in entries.items()]
+        except (AttributeError, TypeError, ValueError):
+            return False
+        for hanzi, annotation in annotations:
+            self.cache.put(hanzi, annotation)
+        return True
+
+    def save(self, path=ANNOTATION_CACHE_FILE):
+        """Persists the cached annotations, so the next session starts with a warm cache"""
+        entries = {hanzi: list(annotation) for hanzi, annotation in self.cache.items()}
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size of the cache"""
+        return self.cache.stats()
@@ -0,0 +1,295 @@
+import argparse
+import hmac
+import http.client
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOPBACK = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Written by the server at startup, readable by its user only; every request must send it in the token header, so
+# other users' processes on the same machine can not use the server (and read or write files with its privileges)
+TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".hanzi_annotation_token")
+TOKEN_HEADER = "X-Annotation-Token"
+# Seconds the client waits for an answer: annotations take microseconds, a pdf of a large text may take minutes
+REQUEST_TIMEOUT = 5
+PDF_REQUEST_TIMEOUT = 600
+# The PdfCreator parameters a /pdf request may set (plus segment_words); the server provides the caches itself
+PDF_REQUEST_PARAMETERS = frozenset(["input_file", "input_text", "headline", "output_file", "new_line_for_sentence",
+                                    "large_text", "segment_words", "stream", "output_profile"])
+
+
+class AnnotationServerError(Exception):
+    """The annotation server answered a request with an error"""
+
+
+def write_token(path=TOKEN_FILE):
+    """Writes a new random token to a file only the current user can read, and returns it"""
+    token = secrets.token_hex(32)
+    temp_path = path + ".tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    # the mode of an existing file is kept by os.open
+    os.chmod(temp_path, 0o600)
+    os.replace(temp_path, path)
+    return token
+
+
+def read_token(path=TOKEN_FILE):
+    """Returns the token of the running server. Raises OSError if there is none."""
+    with open(path) as f:
+        return f.read().strip()
+
+
+def split_for_annotation(text, mode, segmenter):
+    """Splits a text into the parts to annotate: dictionary words (mode 'words'), single characters (mode
+    'characters'), or the whole text as one part (mode 'whole')"""
+    if mode == "words":
+        return segmenter.segment(text)
+    if mode == "characters":
+        return list(text)
+    if mode == "whole":
+        return [text]
+    raise ValueError(f"Unknown annotation mode '{mode}'")
+
+
+def annotate_text(text, mode, segmenter, annotation_cache):
+    """Returns (hanzi, pinyin, gloss) for each part of the text, see split_for_annotation. In mode 'characters', each
+    character gets its reading in the dictionary word it belongs to."""
+    annotations = [(part, *annotation_cache.get(part)[:2]) for part in split_for_annotation(text, mode, segmenter)]
+    if mode == "characters":
+        pinyins = annotation_cache.text_pinyins(segmenter.segment(text))
+        annotations = [(part, pinyin, gloss) for (part, _, gloss), pinyin in zip(annotations, pinyins)]
+    return annotations
+
+
+class AnnotationService:
+    """
+    Keeps the dictionary, segmenter, pinyin resolver and annotation cache loaded once, and answers annotation and pdf
+    requests with them. Annotations are computed directly on the event loop (they take microseconds); pdfs are
+    rendered in a background thread, so annotation requests are still answered while a pdf is being created.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, token_file=TOKEN_FILE):
+        from dict import Dict
+        from segmenter import Segmenter
+        from annotationCache import AnnotationCache
+        from layoutCache import LayoutCache
+        from pinyinResolver import PinyinResolver
+        # requests must be addressed to exactly this host, which keeps out web pages (DNS rebinding)
+        self.host = f"{LOOPBACK}:{port}"
+        self.token = write_token(token_file)
+        self.dict = Dict()
+        self.segmenter = Segmenter(self.dict.words)
+        self.pinyin_resolver = PinyinResolver(self.dict)
+        self.annotation_cache = AnnotationCache(self.dict, resolver=self.pinyin_resolver)
+        if not self.annotation_cache.load(dictionary_index=self.dict.index):
+            self.annotation_cache.warm()
+        # shared by all pdf requests, so repeated exports of a growing session only lay out the new sentences
+        self.layout_cache = LayoutCache()
+        metrics.add_source("annotation_cache", self.annotation_cache.stats)
+        metrics.add_source("pinyin_resolver", self.pinyin_resolver.stats)
+        metrics.add_source("layout_cache", self.layout_cache.stats)
+        self.pdf_executor = ThreadPoolExecutor(max_workers=1)
+        self.started = time.time()
+
+    def annotate(self, text, mode="words"):
+        """Returns [hanzi, pinyin, gloss] for each part of the text, see split_for_annotation"""
+        return [list(annotation) for annotation in annotate_text(text, mode, self.segmenter, self.annotation_cache)]
+
+    def create_pdf(self, request):
+        """Renders a pdf in the calling (background) thread. Paths are resolved by the client; only absolute paths
+        ending in .pdf are written to."""
+        from pdfCreator import PdfCreator
+        unknown = set(request) - PDF_REQUEST_PARAMETERS
+        if unknown:
+            raise AnnotationServerError(f"Unknown pdf parameters: {', '.join(sorted(unknown))}")
+        output_file = request.get("output_file")
+        if not isinstance(output_file, str) or not os.path.isabs(output_file) or \
+                not output_file.lower().endswith(".pdf"):
+            raise AnnotationServerError("output_file must be an absolute path ending in .pdf")
+        segmenter = self.segmenter if request.pop("segment_words", False) else None
+        pdf_creator = PdfCreator(segmenter=segmenter, annotation_cache=self.annotation_cache,
+                                 layout_cache=self.layout_cache, **request)
+        pdf_creator.create_pdf()
+        if not hasattr(pdf_creator, "output_size"):
+            raise AnnotationServerError("No pdf was created: no input text.")
+        return {"output_file": pdf_creator.output_file, "size": pdf_creator.output_size,
+                "seconds": pdf_creator.render_seconds}
+
+    async def dispatch(self, method, path, headers, body):
+        """Returns (HTTP status, JSON payload) for a request. Requests from web pages are refused: they can not set
+        the Host header, and a POST with a JSON content type needs a CORS preflight, which is never answered.
+        Requests without the token of the server's user are refused as well."""
+        if headers.get("host") != self.host:
+            return "403 Forbidden", {"error": f"Requests must be addressed to {self.host}"}
+        if not hmac.compare_digest(headers.get(TOKEN_HEADER.lower(), "").encode("latin1"), self.token.encode("ascii")):
+            return "403 Forbidden", {"error": f"Requests must send the token from {TOKEN_FILE}"}
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            return "415 Unsupported Media Type", {"error": "Requests must be sent as application/json"}
+        try:
+            request = json.loads(body) if body else {}
+            if method == "GET" and path == "/status":
+                return "200 OK", {"entries": len(self.dict.words), "uptime": time.time() - self.started,
+                                  "annotation_cache": self.annotation_cache.stats(),
+                                  "pinyin_resolver": self.pinyin_resolver.stats(),
+                                  "layout_cache": self.layout_cache.stats()}
+            if method == "GET" and path == "/metrics":
+                return "200 OK", metrics.snapshot()
+            if method == "POST" and path == "/annotate":
+                # batching: several texts can be annotated with a single request
+                mode = request.get("mode", "words")
+                texts = request["texts"] if "texts" in request else [request["text"]]
+                with metrics.timed("server.annotate"):
+                    return "200 OK", {"results": [self.annotate(text, mode) for text in texts]}
+            if method == "POST" and path == "/pdf":
+                import asyncio
+                loop = asyncio.get_running_loop()
+                return "200 OK", await loop.run_in_executor(self.pdf_executor, self.create_pdf, request)
+            return "404 Not Found", {"error": f"Unknown request {method} {path}"}
+        except (ValueError, KeyError, TypeError, AnnotationServerError) as e:
+            return "400 Bad Request", {"error": str(e)}
+        except OSError as e:
+            # e.g. the output directory of a pdf does not exist
+            logger.warning(f"{method} {path} failed: {e}")
+            return "500 Internal Server Error", {"error": str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """Answers the HTTP/1.1 requests of one connection. Connections are kept alive unless the client closes."""
+        import asyncio
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.dispatch(method, path, headers, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload, ensure_ascii=False).encode("utf8")
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                             f"\r\n\r\n".encode("latin1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(port=DEFAULT_PORT, token_file=TOKEN_FILE):
+    # asyncio is only imported on the server side, the client is imported by the interpreter at startup
+    import asyncio
+    service = AnnotationService(port, token_file)
+    # Only ever bound to the loopback interface: the server is meant for processes on this machine
+    server = await asyncio.start_server(service.handle_connection, LOOPBACK, port)
+    logger.info(f"Annotation server listening on http://{LOOPBACK}:{port} (dictionary with {len(service.dict.words)} "
+                f"entries).")
+    async with server:
+        await server.serve_forever()
+
+
+class AnnotationClient:
+    """
+    Keep-alive client for a running annotation server. Thread safe, as the interpreter uses it from its
+    interpretation worker thread as well as from the tkinter thread. The server's token is read whenever the client
+    (re)connects, so a restarted server is used with its new token.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, connect_timeout=0.2, token_file=TOKEN_FILE):
+        self.connect_timeout = connect_timeout
+        self.token_file = token_file
+        self.token = None
+        self.connection = http.client.HTTPConnection(LOOPBACK, port, timeout=connect_timeout)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def connect(port=DEFAULT_PORT, token_file=TOKEN_FILE):
+        """Returns a client connected to the annotation server, or None if no server is running (or its token can not
+        be read)"""
+        client = AnnotationClient(port, token_file=token_file)
+        try:
+            client.request("GET", "/status")
+        except (OSError, http.client.HTTPException, AnnotationServerError):
+            return None
+        return client
+
+    def request(self, method, path, payload=None, retry=True, timeout=REQUEST_TIMEOUT):
+        """Sends a request and returns the decoded JSON answer, waiting at most timeout seconds for it. A connection
+        which was closed in the meantime is reopened once; without retry (for requests which must not run twice, like
+        rendering a pdf), only if the request could not be sent. Raises OSError if the server can not be reached or
+        does not answer in time."""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf8") if payload is not None else None
+        with self.lock:
+            for attempt in range(2):
+                sent = False
+                try:
+                    if self.connection.sock is None:
+                        self.token = read_token(self.token_file)
+                        self.connection.connect()
+                    self.connection.sock.settimeout(timeout)
+                    headers = {"Content-Type": "application/json; charset=utf-8", TOKEN_HEADER: self.token}
+                    self.connection.request(method, path, body=body, headers=headers)
+                    sent = True
+                    response = self.connection.getresponse()
+                    answer = json.loads(response.read())
+                    break
+                except (http.client.HTTPException, ConnectionError) as e:
+                    self.connection.close()
+                    if attempt == 1 or (sent and not retry):
+                        raise ConnectionError(f"Annotation server connection failed: {e}")
+                except OSError:
+                    # e.g. a timeout: the answer may still arrive, so the connection can not be used any more
+                    self.connection.close()
+                    raise
+        if response.status != 200:
+            raise AnnotationServerError(answer.get("error", response.reason))
+        return answer
+
+    def annotate(self, texts, mode="words"):
+        """Returns [hanzi, pinyin, gloss] lists for the words (or characters) of each text"""
+        return self.request("POST", "/annotate", {"texts": texts, "mode": mode})["results"]
+
+    def create_pdf(self, input_file=None, output_file="OutputFile", **kwargs):
+        """Lets the server render a pdf. Takes the same parameters as PdfCreator, plus segment_words."""
+        if input_file:
+            input_file = os.path.abspath(input_file)
+        return self.request("POST", "/pdf", dict(input_file=input_file, output_file=os.path.abspath(output_file),
+                                                 **kwargs), retry=False, timeout=PDF_REQUEST_TIMEOUT)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local annotation server, keeping the dictionary loaded for '
+                                                 'the interpreter and the pdf creator.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port on 127.0.0.1 to listen on')
+    parser.add_argument('--log_level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='DEBUG also logs every sentence of the pdfs created')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    import asyncio
+    try:
+        asyncio.run(serve(args.port))
+    except KeyboardInterrupt:
+        logger.info("Annotation server stopped.")
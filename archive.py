@@ -0,0 +1,142 @@
+from tkinter import END
+
+
+class ArchiveStore:
+    """
+    Holds the lines the user has moved to the archive. The display text of each line (Chinese text and pinyin) is
+    built once, when the line is added; exports read the lines from here instead of from the archive widget, and the
+    pdf export reuses the pinyin of every character instead of annotating the lines again. With a SessionJournal, the
+    lines are kept in the journal only, otherwise in memory.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.texts = []
+        self.pinyins = []
+        self.character_pinyins = []
+
+    def append(self, text, pinyin, character_pinyins=None):
+        """Adds a line and returns its number. character_pinyins holds the pinyin of every character of the line."""
+        if self.journal is not None:
+            return self.journal.append(text, pinyin, character_pinyins)
+        self.texts.append(text)
+        self.pinyins.append(pinyin)
+        self.character_pinyins.append(character_pinyins)
+        return len(self.texts) - 1
+
+    def lines(self, first=0, last=None):
+        """Yields (text, pinyin) of the lines first to last (exclusive)"""
+        if self.journal is not None:
+            yield from self.journal.read(first, last)
+        else:
+            yield from zip(self.texts[first:last], self.pinyins[first:last])
+
+    def display_line(self, i):
+        """Returns line number i as shown in the archive, including the line break"""
+        return next(self.display_lines(i, i + 1))
+
+    def display_lines(self, first=0, last=None):
+        """Yields the archive lines first to last (exclusive) as shown in the archive"""
+        for text, pinyin in self.lines(first, last):
+            yield f"{text}  -  {pinyin}\n"
+
+    def annotated_lines(self):
+        """Yields (text, pinyin of every character or None) of every line, e.g. for PdfCreator's annotated_lines"""
+        if self.journal is not None:
+            yield from self.journal.read_pinyins()
+        else:
+            yield from zip(self.texts, self.character_pinyins)
+
+    def chinese_lines(self):
+        """Yields the Chinese text of every line, e.g. for PdfCreator's input_lines"""
+        for text, _ in self.lines():
+            yield text + "\n"
+
+    def __len__(self):
+        return len(self.journal) if self.journal is not None else len(self.texts)
+
+
+class ArchiveView:
+    """
+    Shows an ArchiveStore in a tkinter Text widget, which only ever holds a window of at most window_lines lines.
+    New lines are inserted with a single call while the window is at the end of the archive; scrolling to the top
+    or bottom of the widget pages older or newer lines in, page_lines at a time, and drops the lines at the other
+    end. Each line of the store is exactly one line of the widget: widget line k shows store line first + k - 1.
+    """
+
+    def __init__(self, text_widget, store, window_lines=500, page_lines=100):
+        self.text = text_widget
+        self.store = store
+        self.window_lines = window_lines
+        self.page_lines = page_lines
+        self.first = 0
+        self.last = 0
+        self.paging = None
+        self.text.config(yscrollcommand=self.scrolled)
+
+    def show_end(self):
+        """Fills the widget with the last window_lines lines of the store, e.g. when a session is resumed"""
+        self.text.config(state='normal')
+        self.text.delete("1.0", END)
+        self.first = max(0, len(self.store) - self.window_lines)
+        self.last = len(self.store)
+        self.text.insert(END, "".join(self.store.display_lines(self.first, self.last)))
+        self.text.config(state='disabled')
+        self.text.see(END)
+
+    def append(self, line_number):
+        """Shows the store's new line line_number, if the window is at the end of the archive"""
+        if self.last != line_number:
+            # the user is looking at older lines; the new one is paged in when scrolling down
+            return
+        follow = self.text.yview()[1] >= 1.0
+        self.text.config(state='normal')
+        self.text.insert(END, self.store.display_line(line_number))
+        self.last += 1
+        self.trim_top()
+        self.text.config(state='disabled')
+        if follow:
+            self.text.see(END)
+
+    def trim_top(self):
+        """Drops the oldest lines beyond window_lines. Returns how many were dropped."""
+        excess = self.last - self.first - self.window_lines
+        if excess <= 0:
+            return 0
+        self.text.delete("1.0", f"{excess + 1}.0")
+        self.first += excess
+        return excess
+
+    def trim_bottom(self):
+        """Drops the newest lines beyond window_lines"""
+        excess = self.last - self.first - self.window_lines
+        if excess > 0:
+            self.text.delete(f"{self.window_lines + 1}.0", END)
+            self.last -= excess
+
+    def scrolled(self, top, bottom):
+        """yscrollcommand of the Text widget: pages lines in once the view reaches either end of the window"""
+        if self.paging is None and ((float(top) <= 0.0 and self.first > 0) or
+                                    (float(bottom) >= 1.0 and self.last < len(self.store))):
+            # widgets must not be changed from within their own scroll callback
+            self.paging = self.text.after_idle(self.page)
+
+    def page(self):
+        self.paging = None
+        top, bottom = self.text.yview()
+        top_line = int(self.text.index("@0,0").split(".")[0])
+        self.text.config(state='normal')
+        if top <= 0.0 and self.first > 0:
+            first = max(0, self.first - self.page_lines)
+            self.text.insert("1.0", "".join(self.store.display_lines(first, self.first)))
+            top_line += self.first - first
+            self.first = first
+            self.trim_bottom()
+        elif bottom >= 1.0 and self.last < len(self.store):
+            last = min(len(self.store), self.last + self.page_lines)
+            self.text.insert(END, "".join(self.store.display_lines(self.last, last)))
+            self.last = last
+            top_line -= self.trim_top()
+        self.text.config(state='disabled')
+        # keep the lines which were visible before in view
+        self.text.yview(f"{max(top_line, 1)}.0")
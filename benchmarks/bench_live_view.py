@@ -0,0 +1,65 @@
+"""
+Measures the per-keystroke latency of the live interpretation, by feeding a long text into the interpreter one
+character at a time. The lookups (which run in the interpretation pipeline's worker thread, through the annotation
+server if one is running) and the widget updates including tkinter's layout (which run on the main loop) are timed
+separately. Requires a display.
+
+Run from the repository root:
+    python benchmarks/bench_live_view.py
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dict import Dict
+from main import Interpreter, RENDER_LATENCY_BUDGET_MS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the live interpretation per keystroke.')
+    parser.add_argument('--length', type=int, default=250, help='Number of characters to type')
+    args = parser.parse_args()
+
+    interpreter = Interpreter(run_mainloop=False, background_loading=False)
+    rng = random.Random(0)
+    # with an annotation server, the interpreter has no dictionary of its own
+    dictionary = interpreter.dict or Dict()
+    print(f"Lookups {'through the annotation server' if interpreter.annotation_client else 'in this process'}.")
+    headwords = [word for word in dictionary.words if ord(word[0]) > 0x3000]
+    text = ""
+    while len(text) < args.length:
+        text += rng.choice(headwords)
+    text = text[:args.length]
+
+    interpreter.apply_interpretation([])
+    interpreter.render_latencies.clear()
+    lookup_latencies = []
+    keystroke_latencies = []
+    for i in range(1, len(text) + 1):
+        start = time.perf_counter()
+        annotations = interpreter.annotate(text[:i])
+        lookup_latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        interpreter.apply_interpretation(annotations)
+        interpreter.root.update()
+        keystroke_latencies.append((time.perf_counter() - start) * 1000)
+
+    for name, latencies in (("lookups (worker)", lookup_latencies),
+                            ("apply_interpretation", list(interpreter.render_latencies)),
+                            ("apply incl. layout", keystroke_latencies)):
+        latencies.sort()
+        print(f"{name:>24}: median {statistics.median(latencies):6.2f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:6.2f} ms, max {latencies[-1]:6.2f} ms")
+    over_budget = sum(latency > RENDER_LATENCY_BUDGET_MS for latency in keystroke_latencies)
+    print(f"{over_budget} of {len(keystroke_latencies)} keystrokes exceeded the {RENDER_LATENCY_BUDGET_MS} ms budget "
+          f"on the main loop.")
+    interpreter.root.destroy()
+
+
+if __name__ == '__main__':
+    main()
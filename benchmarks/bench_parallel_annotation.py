@@ -0,0 +1,78 @@
+"""
+Measures how the PDF creation of a large generated corpus scales with the number of annotation worker processes
+(PdfCreator's annotation_workers), from 1 (annotation in the main process) up to the number of CPU cores, and checks
+that every run produces the same layout as the sequential one. The corpus draws from the whole CJK block, so the
+pinyin lookups dominate as they do for real, large texts.
+
+Run from the repository root:
+    python benchmarks/bench_parallel_annotation.py
+    python benchmarks/bench_parallel_annotation.py --lines 20000 --max_workers 8 --chunk_size 128
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdfCreator import PdfCreator
+
+PUNCTUATION = "，。！？"
+
+
+def make_text(lines, rng):
+    """Generates lines of 20 to 60 random hanzi of the CJK block, with some punctuation"""
+    return "\n".join("".join(chr(0x4E00 + rng.randrange(20000)) if rng.random() > 0.08 else rng.choice(PUNCTUATION)
+                             for _ in range(rng.randint(20, 60))) for _ in range(lines))
+
+
+class LayoutRecorder(PdfCreator):
+    """PdfCreator which additionally hashes every glyph it places, to compare the runs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.glyph_hash = hashlib.sha1()
+
+    def queue_onto_canvas(self, hanzi, pinyin):
+        self.glyph_hash.update(f"{hanzi}{pinyin}{self.x_on_page:.2f}{self.y_on_page:.2f}".encode("utf8"))
+        super().queue_onto_canvas(hanzi, pinyin)
+
+
+def render(text, output_file, workers, chunk_size):
+    """Renders the text and returns (seconds, pages, hash of the placed glyphs)"""
+    start = time.perf_counter()
+    pdf_creator = LayoutRecorder(input_text=text, output_file=output_file, annotation_workers=workers,
+                                 annotation_chunk_size=chunk_size)
+    pdf_creator.create_pdf()
+    seconds = time.perf_counter() - start
+    return seconds, pdf_creator.canvas.getPageNumber() - 1, pdf_creator.glyph_hash.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parallel annotation pre-pass of the PDF creator.')
+    parser.add_argument('--lines', type=int, default=9000, help='Number of text lines (900 lines are ~100 pages)')
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count(), help='Largest number of workers to try')
+    parser.add_argument('--chunk_size', type=int, default=64, help='Sentences per chunk handed to a worker')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    text = make_text(args.lines, random.Random(0))
+    print(f"{len(text)} characters, {os.cpu_count()} CPU cores, chunk size {args.chunk_size}\n")
+    print(f"{'workers':>8} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'speedup':>8} {'same layout':>12}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for workers in range(1, max(1, args.max_workers) + 1):
+            seconds, pages, glyph_hash = render(text, os.path.join(temp_dir, f"{workers}.pdf"), workers,
+                                                args.chunk_size)
+            if baseline is None:
+                baseline = (seconds, glyph_hash)
+            print(f"{workers:>8} {pages:>6} {seconds:>8.2f} {pages / seconds:>8.1f} {baseline[0] / seconds:>7.2f}x "
+                  f"{str(glyph_hash == baseline[1]):>12}")
+
+
+if __name__ == '__main__':
+    main()
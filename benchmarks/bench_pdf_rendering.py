@@ -0,0 +1,73 @@
+"""
+Compares drawing every glyph separately (setFont / setFillColorRGB / drawCentredString per hanzi and per pinyin)
+with the batched drawing of whole lines as text objects, on a generated document of about 100 pages, followed by the
+file size and render time of every output profile.
+
+Run from the repository root:
+    python benchmarks/bench_pdf_rendering.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdfCreator import PdfCreator, OUTPUT_PROFILES
+
+COMMON_HANZI = "的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可里后" \
+               "小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长" \
+               "，。！？"
+
+
+def make_text(lines, rng):
+    """Generates lines of 20 to 60 random common hanzi and punctuation"""
+    return "\n".join("".join(rng.choice(COMMON_HANZI) for _ in range(rng.randint(20, 60))) for _ in range(lines))
+
+
+def render(text, output_file, batch_drawing, output_profile="default"):
+    """Renders the text and returns (seconds, pages, file size)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pdf_creator = PdfCreator(input_text=text, output_file=output_file, batch_drawing=batch_drawing,
+                                 output_profile=output_profile)
+        pdf_creator.create_pdf()
+    seconds = time.perf_counter() - start
+    return seconds, pdf_creator.canvas.getPageNumber() - 1, os.path.getsize(output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-glyph against batched PDF text drawing.')
+    parser.add_argument('--lines', type=int, default=900, help='Number of text lines (900 lines are ~100 pages)')
+    parser.add_argument('--repeat', type=int, default=3, help='Renderings per mode, the fastest one is reported')
+    args = parser.parse_args()
+
+    text = make_text(args.lines, random.Random(0))
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, batch_drawing in (("per glyph", False), ("batched", True)):
+            runs = [render(text, os.path.join(temp_dir, f"{name}.pdf"), batch_drawing) for _ in range(args.repeat)]
+            results[name] = min(runs)
+        profile_results = {}
+        for output_profile in OUTPUT_PROFILES:
+            runs = [render(text, os.path.join(temp_dir, f"{output_profile}.pdf"), True, output_profile)
+                    for _ in range(args.repeat)]
+            profile_results[output_profile] = min(runs)
+
+    print(f"{'mode':>10} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'size (KB)':>10}")
+    for name, (seconds, pages, size) in results.items():
+        print(f"{name:>10} {pages:>6} {seconds:>8.2f} {pages / seconds:>8.1f} {size / 1024:>10.1f}")
+    print(f"\nSpeedup: {results['per glyph'][0] / results['batched'][0]:.2f}x, "
+          f"size: {results['batched'][2] / results['per glyph'][2]:.0%} of per glyph output\n")
+
+    print(f"{'profile':>10} {'seconds':>8} {'pages/s':>8} {'size (KB)':>10}")
+    for output_profile, (seconds, pages, size) in profile_results.items():
+        print(f"{output_profile:>10} {seconds:>8.2f} {pages / seconds:>8.1f} {size / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
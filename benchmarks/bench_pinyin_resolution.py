@@ -0,0 +1,84 @@
+"""
+Compares the throughput of the per-character pinyin (every hanzi gets its most common reading, as the PDF creator does
+without a dictionary) with the context-sensitive resolution (each hanzi read in the dictionary word it belongs to,
+through the polyphone table and the memo of PinyinResolver). The text is drawn from a vocabulary of random headwords
+with Zipf distributed frequencies, as words are distributed in real texts. The resolution is timed
+with a cold and a warm memo, with and without the segmentation it needs; the share of hanzi whose reading changed
+is printed as well.
+
+Run from the repository root:
+    python benchmarks/bench_pinyin_resolution.py
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dict import Dict
+from segmenter import Segmenter
+from annotationCache import AnnotationCache
+from pinyinResolver import PinyinResolver
+from charClassifier import is_hanzi
+
+
+def make_text(headwords, length, vocabulary_size, rng):
+    """Builds a text of the given length from a vocabulary of random headwords, the word of rank r occurring with a
+    frequency proportional to 1 / r"""
+    vocabulary = rng.sample(headwords, vocabulary_size)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    text = ""
+    while len(text) < length:
+        text += "".join(rng.choices(vocabulary, weights, k=1000))
+    return text[:length]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-character against context-sensitive pinyin.')
+    parser.add_argument('--length', type=int, default=100000, help='Number of characters of the text')
+    parser.add_argument('--vocabulary', type=int, default=20000, help='Number of different words in the text')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per warm measurement, the fastest one is reported')
+    args = parser.parse_args()
+
+    dictionary = Dict()
+    segmenter = Segmenter(dictionary.words)
+    headwords = [word for word in dictionary.words if ord(word[0]) > 0x3000]
+    text = make_text(headwords, args.length, args.vocabulary, random.Random(0))
+    words = segmenter.segment(text)
+
+    # both paths share the cache of the per-character readings, so both measure warm character lookups
+    resolver = PinyinResolver(dictionary)
+    annotation_cache = AnnotationCache(resolver=resolver)
+    per_character = [annotation_cache.pinyin(char) for char in text]
+
+    def run_cold():
+        resolver.memo.clear()
+        return annotation_cache.text_pinyins(words)
+
+    results = {
+        "per character": min(timeit.repeat(lambda: [annotation_cache.pinyin(char) for char in text],
+                                           number=1, repeat=args.repeat)),
+        "resolved, cold memo": min(timeit.repeat(run_cold, number=1, repeat=args.repeat)),
+        "resolved, warm memo": min(timeit.repeat(lambda: annotation_cache.text_pinyins(words),
+                                                 number=1, repeat=args.repeat)),
+        "incl. segmentation": min(timeit.repeat(lambda: annotation_cache.text_pinyins(segmenter.segment(text)),
+                                                number=1, repeat=args.repeat)),
+    }
+    resolved = annotation_cache.text_pinyins(words)
+    hanzi = sum(1 for char in text if is_hanzi(char))
+    changed = sum(1 for char, old, new in zip(text, per_character, resolved) if is_hanzi(char) and old != new)
+    stats = resolver.stats()
+
+    print(f"{len(text)} characters in {len(words)} words, {stats['polyphones']} polyphones in the table")
+    print(f"{stats['skipped']} word lookups skipped (no polyphone), {stats['size']} words memoized\n")
+    print(f"{'path':>20} {'ms':>9} {'chars/s':>12} {'vs per char':>12}")
+    for name, seconds in results.items():
+        print(f"{name:>20} {seconds * 1000:>9.1f} {len(text) / seconds:>12.0f} "
+              f"{seconds / results['per character']:>11.2f}x")
+    print(f"\n{changed} of {hanzi} hanzi ({changed / hanzi:.1%}) read differently in context")
+
+
+if __name__ == '__main__':
+    main()
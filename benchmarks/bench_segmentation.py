@@ -0,0 +1,74 @@
+"""
+Benchmarks the trie based Segmenter against naive substring probing (trying every word length from the longest
+headword down to a single character at each position, with a dictionary lookup per probe).
+
+Run from the repository root:
+    python benchmarks/bench_segmentation.py
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dict import Dict
+from segmenter import Segmenter
+
+
+def naive_segment(text, words, max_word_length):
+    """Longest match by probing every substring length at every position"""
+    result = []
+    start = 0
+    while start < len(text):
+        end = start + 1
+        for length in range(min(max_word_length, len(text) - start), 1, -1):
+            if text[start:start + length] in words:
+                end = start + length
+                break
+        result.append(text[start:end])
+        start = end
+    return result
+
+
+def make_text(headwords, length, rng):
+    """Builds a text of the given length by concatenating random headwords"""
+    text = ""
+    while len(text) < length:
+        text += rng.choice(headwords)
+    return text[:length]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark word segmentation.')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 50, 200, 500],
+                        help='Input lengths (in characters) to benchmark')
+    parser.add_argument('--repeat', type=int, default=20, help='Segmentations per measurement')
+    args = parser.parse_args()
+
+    dictionary = Dict()
+    start = timeit.default_timer()
+    segmenter = Segmenter(dictionary.words)
+    print(f"Segmenter built in {timeit.default_timer() - start:.3f}s "
+          f"({len(segmenter.prefixes)} trie prefixes)\n")
+
+    rng = random.Random(0)
+    headwords = [word for word in dictionary.words if ord(word[0]) > 0x3000]
+    word_set = set(dictionary.words)
+
+    print(f"{'chars':>6} {'trie (ms)':>10} {'naive set (ms)':>15} {'naive index (ms)':>17} {'speedup':>8}")
+    for length in args.lengths:
+        text = make_text(headwords, length, rng)
+        assert segmenter.segment(text) == naive_segment(text, word_set, segmenter.max_word_length)
+        trie = timeit.timeit(lambda: segmenter.segment(text), number=args.repeat) / args.repeat
+        naive_set = timeit.timeit(lambda: naive_segment(text, word_set, segmenter.max_word_length),
+                                  number=args.repeat) / args.repeat
+        naive_index = timeit.timeit(lambda: naive_segment(text, dictionary.words, segmenter.max_word_length),
+                                    number=args.repeat) / args.repeat
+        print(f"{length:>6} {trie * 1000:>10.3f} {naive_set * 1000:>15.3f} {naive_index * 1000:>17.3f} "
+              f"{naive_index / trie:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Reproducible, headless benchmark suite (no tkinter display needed). Covers dictionary compile/load time, lookups per
+second, per-character annotation throughput and PDF pages per second. The dictionary is a synthetic CEDICT-format
+fixture and the texts are generated corpora of several sizes, both seeded, so every run measures the same work.
+
+Results are written as JSON and compared against a stored baseline; a metric which is worse than the baseline by
+more than the tolerance counts as a regression, and the script exits with status 1. Metrics which were not measured
+(or are missing from the baseline) are reported as skipped.
+
+The PDF benchmark needs the pinyin font res/NotoSansSC-Medium.ttf (Noto Sans SC, weight Medium), which is not part
+of the repository, and is skipped without it; the stored baseline therefore has no PDF metrics. To compare them,
+record a baseline of your own with the font in place.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --save_baseline True
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dict import Dict
+from annotationCache import AnnotationCache
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PINYIN_FONT_FILE = "res/NotoSansSC-Medium.ttf"
+
+# Characters for the fixture and the corpora: the 3000 code points from the start of the CJK block, plus punctuation
+HANZI = [chr(0x4E00 + i) for i in range(3000)]
+PUNCTUATION = "，。！？"
+SYLLABLES = ["ba", "ma", "zhong", "guo", "xue", "sheng", "shu", "guan", "hao", "ren", "wo", "ni", "ta", "de", "le"]
+
+
+def make_cedict_fixture(path, entries, rng):
+    """Writes a synthetic dictionary in CEDICT format (traditional simplified [pinyin] /gloss/gloss/)"""
+    with open(path, "w", encoding="utf8") as f:
+        for i in range(entries):
+            # the first entries cover every single character, the rest are words of 2 to 4 characters
+            word = HANZI[i] if i < len(HANZI) else "".join(rng.choice(HANZI) for _ in range(rng.randint(2, 4)))
+            syllables = " ".join(f"{rng.choice(SYLLABLES)}{rng.randint(1, 5)}" for _ in word)
+            f.write(f"{word} {word} [{syllables}] /meaning {i}/another meaning of entry {i}/\n")
+
+
+def make_corpus(length, rng):
+    """Generates a text of length characters: hanzi, with punctuation and line breaks in between"""
+    lines = []
+    total = 0
+    while total < length:
+        line = "".join(rng.choice(HANZI) if rng.random() > 0.08 else rng.choice(PUNCTUATION)
+                       for _ in range(min(rng.randint(20, 60), length - total)))
+        lines.append(line)
+        total += len(line)
+    return "\n".join(lines)
+
+
+def timed(repeat, function):
+    """Calls function repeat times with stdout suppressed. Returns the result of the last call and the fastest
+    time, which is the least disturbed by other activity on the machine."""
+    fastest = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        seconds = time.perf_counter() - start
+        fastest = seconds if fastest is None else min(fastest, seconds)
+    return result, fastest
+
+
+def benchmark_dictionary(results, temp_dir, entries, rng, repeat):
+    source = os.path.join(temp_dir, "cedict.itp")
+    index = os.path.join(temp_dir, "cedict.idx")
+    make_cedict_fixture(source, entries, rng)
+
+    def compile_and_load():
+        if os.path.exists(index):
+            os.remove(index)
+        Dict(source, index).words.close()
+    _, seconds = timed(repeat, compile_and_load)
+    results["dict_compile_seconds"] = (seconds, "s", False)
+    dictionary, seconds = timed(repeat * 10, lambda: Dict(source, index))
+    results["dict_load_seconds"] = (seconds, "s", False)
+
+    headwords = list(dictionary.words)
+    probes = [rng.choice(headwords) for _ in range(50000)] + ["".join(rng.choices(HANZI, k=5)) for _ in range(50000)]
+    rng.shuffle(probes)
+
+    def look_up():
+        for word in probes:
+            dictionary.translate(word)
+    _, seconds = timed(repeat, look_up)
+    results["dict_lookups_per_second"] = (len(probes) / seconds, "1/s", True)
+    return dictionary
+
+
+def benchmark_annotation(results, dictionary, corpora, repeat):
+    """Annotates every character of each corpus separately, with a cold cache and with a warm one"""
+    for name, corpus in corpora.items():
+        def annotate(cache):
+            for hanzi in corpus:
+                cache.get(hanzi)
+        _, seconds = timed(repeat, lambda: annotate(AnnotationCache(dictionary)))
+        results[f"annotation_cold_{name}_chars_per_second"] = (len(corpus) / seconds, "1/s", True)
+        warm_cache = AnnotationCache(dictionary)
+        annotate(warm_cache)
+        _, seconds = timed(repeat, lambda: annotate(warm_cache))
+        results[f"annotation_warm_{name}_chars_per_second"] = (len(corpus) / seconds, "1/s", True)
+
+
+def benchmark_pdf(results, skipped, temp_dir, corpora, repeat):
+    if not os.path.exists(PINYIN_FONT_FILE):
+        print(f"Skipping the PDF benchmark: '{PINYIN_FONT_FILE}' not found (run from the repository root).")
+        skipped.extend(f"pdf_{name}_pages_per_second" for name in corpora)
+        return
+    from pdfCreator import PdfCreator
+    for name, corpus in corpora.items():
+        def render():
+            pdf_creator = PdfCreator(input_text=corpus, output_file=os.path.join(temp_dir, f"{name}.pdf"))
+            pdf_creator.create_pdf()
+            return pdf_creator.canvas.getPageNumber() - 1
+        pages, seconds = timed(repeat, render)
+        results[f"pdf_{name}_pages_per_second"] = (pages / seconds, "1/s", True)
+
+
+def compare_with_baseline(metrics, skipped, baseline, tolerance):
+    """Prints the comparison with the baseline and returns the names of all regressed metrics. Skipped metrics and
+    metrics of the baseline which were not measured are listed as skipped."""
+    regressions = []
+    print(f"\n{'metric':<45} {'value':>12} {'baseline':>12} {'change':>8}")
+    for name, metric in metrics.items():
+        reference = baseline.get("metrics", {}).get(name)
+        if reference is None:
+            print(f"{name:<45} {metric['value']:>12.4g} {'-':>12} {'new':>8}")
+            continue
+        change = metric["value"] / reference["value"] - 1 if reference["value"] else 0.0
+        worse = -change if metric["higher_is_better"] else change
+        flag = " REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<45} {metric['value']:>12.4g} {reference['value']:>12.4g} {change:>+8.1%}{flag}")
+    unmeasured = [name for name in baseline.get("metrics", {}) if name not in metrics and name not in skipped]
+    for name in skipped + unmeasured:
+        reference = baseline.get("metrics", {}).get(name)
+        reference = f"{reference['value']:.4g}" if reference else "-"
+        print(f"{name:<45} {'-':>12} {reference:>12} {'skipped':>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the headless benchmark suite.')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file for the results')
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE, help='JSON file with the baseline results')
+    parser.add_argument('--save_baseline', type=bool, default=False,
+                        help='True to store the results as the new baseline instead of comparing against it')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative slowdown accepted before a metric counts as a regression (default: 0.25)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repetitions per measurement, the fastest one is reported (default: 3)')
+    parser.add_argument('--entries', type=int, default=110000, help='Entries of the synthetic dictionary')
+    parser.add_argument('--corpus_sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Sizes (in characters) of the generated corpora')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpora = {f"{size}": make_corpus(size, rng) for size in args.corpus_sizes}
+    results = {}
+    skipped = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dictionary = benchmark_dictionary(results, temp_dir, args.entries, rng, args.repeat)
+        benchmark_annotation(results, dictionary, corpora, args.repeat)
+        benchmark_pdf(results, skipped, temp_dir, corpora, args.repeat)
+        dictionary.words.close()
+
+    metrics = {name: {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+               for name, (value, unit, higher_is_better) in results.items()}
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                              "processor": platform.processor()},
+              "parameters": {"entries": args.entries, "corpus_sizes": args.corpus_sizes},
+              "metrics": metrics, "skipped": skipped}
+    with open(args.output, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{args.output}'.")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to '{args.baseline}'.")
+        return
+    try:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline found at '{args.baseline}'. Use --save_baseline True to create one.")
+        return
+    if baseline.get("parameters") != report["parameters"]:
+        print("Warning: the baseline was recorded with different parameters.")
+    regressions = compare_with_baseline(metrics, skipped, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
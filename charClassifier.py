@@ -0,0 +1,112 @@
+"""
+Classifies characters as hanzi, punctuation, latin letters, digits, spaces or other characters (emoji, kana, ...).
+
+All characters of the Basic Multilingual Plane are classified into a table indexed by code point. The table is built
+once and kept in res/char_classes.bin next to this module (rebuilt when Python's Unicode version changes), so imports
+only read it; if res/ is not writable, it is built in memory on every import. Characters beyond it (CJK extension B and
+later, emoji) are classified by range. Full-width forms count like their ASCII counterparts (full-width digits are
+digits, full-width letters are latin). Math, currency and modifier symbols count as punctuation, other symbols (★, ❤,
+emoji) as other characters.
+"""
+import os
+import re
+import unicodedata
+
+HANZI = 0
+PUNCTUATION = 1
+LATIN = 2
+DIGIT = 3
+SPACE = 4
+OTHER = 5
+
+# CJK unified ideographs (incl. extension A), compatibility ideographs, and the ideographic zero 〇
+HANZI_RANGES = [(0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x3007, 0x3007)]
+# CJK unified ideographs extension B and later, and the compatibility supplement
+SUPPLEMENTARY_HANZI_RANGE = (0x20000, 0x3134F)
+# Latin letters: basic latin, latin-1, extended A/B (incl. the pinyin tone marks), IPA, extended additional, extended
+# C/D and the full-width forms
+LATIN_RANGES = [(0x41, 0x5A), (0x61, 0x7A), (0xC0, 0x2AF), (0x1E00, 0x1EFF), (0x2C60, 0x2C7F), (0xA720, 0xA7FF),
+                (0xFF21, 0xFF3A), (0xFF41, 0xFF5A)]
+HANZI_PATTERN = "[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3007\U00020000-\U0003134F]"
+# HANZI_PATTERN, compiled on first use: compiling it takes a few milliseconds
+hanzi_regex = None
+
+CLASS_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "res", "char_classes.bin")
+# The table file starts with the magic and the Unicode version it was built with
+CLASS_TABLE_MAGIC = b"CHRCLS02"
+
+
+def build_table():
+    """Returns a bytearray with the category of every code point of the Basic Multilingual Plane"""
+    table = bytearray([OTHER]) * 0x10000
+    for first, last in HANZI_RANGES:
+        table[first:last + 1] = bytes([HANZI]) * (last - first + 1)
+    for code_point in range(0x10000):
+        if table[code_point] == HANZI:
+            continue
+        char = chr(code_point)
+        category = unicodedata.category(char)
+        if char.isspace() or category == "Zs":
+            table[code_point] = SPACE
+        elif category == "Nd":
+            table[code_point] = DIGIT
+        elif category[0] == "P" or category in ("Sm", "Sc", "Sk"):
+            table[code_point] = PUNCTUATION
+        elif category in ("Lu", "Ll", "Lt"):
+            table[code_point] = LATIN if any(first <= code_point <= last for first, last in LATIN_RANGES) else OTHER
+    return table
+
+
+def load_table(path=CLASS_TABLE_FILE):
+    """Returns the table of the Basic Multilingual Plane, read from path if it was built with the same Unicode
+    version, otherwise built and written to path (if its directory is writable)"""
+    header = CLASS_TABLE_MAGIC + unicodedata.unidata_version.encode("ascii").ljust(16)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if data.startswith(header) and len(data) == len(header) + 0x10000:
+            return data[len(header):]
+    except OSError:
+        pass
+    table = build_table()
+    if not os.access(os.path.dirname(path) or ".", os.W_OK):
+        return table
+    try:
+        with open(path + ".tmp", "wb") as f:
+            f.write(header + table)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # e.g. the disk is full; the table is built again next time
+        pass
+    return table
+
+
+TABLE = load_table()
+
+
+def classify(char):
+    """Returns the category of a single character"""
+    code_point = ord(char)
+    if code_point < 0x10000:
+        return TABLE[code_point]
+    if SUPPLEMENTARY_HANZI_RANGE[0] <= code_point <= SUPPLEMENTARY_HANZI_RANGE[1]:
+        return HANZI
+    return OTHER
+
+
+def classify_string(text):
+    """Returns the categories of all characters of a text, in a single pass"""
+    table = TABLE
+    return [table[ord(char)] if ord(char) < 0x10000 else classify(char) for char in text]
+
+
+def contains_hanzi(text):
+    """Returns True if the text contains at least one hanzi"""
+    global hanzi_regex
+    if hanzi_regex is None:
+        hanzi_regex = re.compile(HANZI_PATTERN)
+    return hanzi_regex.search(text) is not None
+
+
+def is_hanzi(char):
+    return classify(char) == HANZI
@@ -1,17 +1,348 @@
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+
+from charClassifier import is_hanzi
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DICTIONARY_SOURCE = "res/cedict.itp"
+DICTIONARY_INDEX = "res/cedict.idx"
+
+# Index layout (all integers uint32, little endian):
+# - header: magic, entry count, and the positions of the headword, pinyin, keyword and polyphone tables
+# - entry count + 1 record offsets, then the entry records. Each record is the utf8 encoded traditional form,
+#   simplified form, pinyin and senses (joined by "/"), separated by NUL bytes. Entries keep the order of the source.
+# - four key tables: headwords (simplified and traditional forms), toneless pinyin, English keywords and polyphones
+#   (hanzi read differently in different entries, with the entries of the character itself). A key table
+#   is its key count n, n + 1 key offsets, n + 1 posting offsets, the concatenated utf8 keys (sorted, padded to 4
+#   bytes) and the postings: the entry numbers of each key, best match first.
+# Keys are sorted by their encoding, which allows a binary search directly on the memory mapped file.
+INDEX_MAGIC = b"CEDIDX03"
+INDEX_HEADER = struct.Struct("<8sIIIII")
+UINT32 = struct.Struct("<I")
+
+# Senses which only refer to another entry; entries consisting of these are ranked after the others
+REFERENCE_SENSE = re.compile(r"^((old|archaic|Japanese) )?variant of |^see |^surname |^also written |^abbr\. for |^CL:")
+NOT_PINYIN_LETTER = re.compile(r"[^a-z]")
+KEYWORD = re.compile(r"[a-z][a-z'-]*[a-z]|[a-z]")
+STOP_WORDS = frozenset(["a", "an", "and", "as", "at", "by", "for", "from", "in", "is", "of", "on", "or", "sb", "sth",
+                        "the", "to", "with"])
+
+
+class Entry:
+	"""A single dictionary entry. Decoded from the index on demand, so __slots__ keeps it small."""
+	__slots__ = ("traditional", "simplified", "pinyin", "senses")
+
+	def __init__(self, traditional, simplified, pinyin, senses):
+		self.traditional = traditional
+		self.simplified = simplified
+		self.pinyin = pinyin
+		self.senses = senses
+
+	def __repr__(self):
+		return f"Entry({self.traditional} {self.simplified} [{self.pinyin}] /{'/'.join(self.senses)}/)"
+
+
+def parse_entry(line):
+	"""Splits a single CEDICT line (traditional simplified [pinyin] /sense/sense/) into an Entry"""
+	traditional, simplified, rest = line.split(" ", 2)
+	pinyin = rest[rest.find("[") + 1:rest.find("]")]
+	senses = tuple(sense for sense in rest[rest.find("/"):].split("/") if len(sense) > 0)
+	return Entry(traditional, simplified, pinyin, senses)
+
+
+def toneless_pinyin(pinyin):
+	"""Normalizes pinyin for the reverse lookup: lower case, without tones (numbers or marks) and spaces, u: and ü
+	become v. 'Zhong1 guo2', 'zhōngguó' and 'zhongguo' all become 'zhongguo'."""
+	pinyin = unicodedata.normalize("NFD", pinyin.lower()).replace("u\u0308", "v").replace("u:", "v")
+	return NOT_PINYIN_LETTER.sub("", pinyin)
+
+
+def rank(entry, headword, number, common_reading):
+	"""Sort key of an entry among the entries of a headword: entries of the simplified form before those only
+	matching the traditional form, common words before proper nouns (capitalized pinyin) and mere references (variant
+	of, surname, ...), then the entry with the most common reading of the characters (common_reading, as numbered
+	pinyin without spaces), then entries with more senses, then the order of the source."""
+	senses = [sense for sense in entry.senses if not REFERENCE_SENSE.match(sense)]
+	reading = entry.pinyin.lower().replace("u:", "v").replace(" ", "")
+	return (entry.simplified != headword, entry.pinyin[:1].isupper(), len(senses) == 0, reading != common_reading,
+	        -len(senses), number)
+
+
+def syllables(entry):
+	"""Returns the numbered pinyin syllables of an entry, one per character ('Xing2' -> 'xing2', 'lu:4' -> 'lv4'), or
+	None if the pinyin does not have one syllable per character"""
+	syllables = entry.pinyin.lower().replace("u:", "v").split()
+	return syllables if len(syllables) == len(entry.simplified) else None
+
+
+def index_is_stale(source=DICTIONARY_SOURCE, index=DICTIONARY_INDEX):
+	"""Returns True if the index is missing, older than the dictionary source file, or in an older format"""
+	try:
+		if os.path.getmtime(index) < os.path.getmtime(source):
+			return True
+		with open(index, "rb") as f:
+			return f.read(len(INDEX_MAGIC)) != INDEX_MAGIC
+	except FileNotFoundError:
+		return True
+
+
+def uint32_bytes(values):
+	values = array("I", values)
+	if sys.byteorder != "little":
+		values.byteswap()
+	return values.tobytes()
+
+
+def write_key_table(f, table):
+	"""Writes a key table (key -> list of entry numbers) at the current position of f. Returns that position."""
+	keys = sorted((key.encode("utf8"), numbers) for key, numbers in table.items())
+	key_offsets = [0]
+	posting_offsets = [0]
+	postings = []
+	for key, numbers in keys:
+		key_offsets.append(key_offsets[-1] + len(key))
+		postings.extend(numbers)
+		posting_offsets.append(len(postings))
+	position = f.tell()
+	f.write(UINT32.pack(len(keys)))
+	f.write(uint32_bytes(key_offsets))
+	f.write(uint32_bytes(posting_offsets))
+	f.write(b"".join(key for key, _ in keys))
+	f.write(b"\0" * (-key_offsets[-1] % 4))
+	f.write(uint32_bytes(postings))
+	return position
+
+
+def compile_index(source=DICTIONARY_SOURCE, index=DICTIONARY_INDEX):
+	"""Compiles the CEDICT source file into the binary index used by DictIndex. Every entry is kept, including
+	several entries for the same headword."""
+	import pinyin as pinyin_library
+	entries = []
+	with open(source, "r", encoding="utf8") as f:
+		for line in f:
+			line = line.rstrip("\r\n")
+			if len(line) == 0 or line.startswith("#"):
+				continue
+			entries.append(parse_entry(line))
+
+	headwords = defaultdict(list)
+	pinyins = defaultdict(list)
+	keywords = defaultdict(dict)
+	readings = defaultdict(set)
+	for number, entry in enumerate(entries):
+		headwords[entry.simplified].append(number)
+		if entry.traditional != entry.simplified:
+			headwords[entry.traditional].append(number)
+		pinyins[toneless_pinyin(entry.pinyin)].append(number)
+		entry_syllables = syllables(entry)
+		if entry_syllables:
+			for form in {entry.simplified, entry.traditional}:
+				for hanzi, syllable in zip(form, entry_syllables):
+					readings[hanzi].add(syllable)
+		for position, sense in enumerate(entry.senses):
+			for keyword in KEYWORD.findall(sense.lower()):
+				if keyword not in STOP_WORDS:
+					# remember the first sense mentioning the keyword, and how many keywords that sense has
+					keywords[keyword].setdefault(number, (position, len(sense.split())))
+	common_readings = {}
+	for headword, numbers in headwords.items():
+		if len(numbers) > 1:
+			# the pinyin library knows the most common reading of each character
+			common_reading = pinyin_library.get(entries[numbers[0]].simplified, format="numerical")
+			numbers.sort(key=lambda number: rank(entries[number], headword, number, common_reading))
+			common_readings[entries[numbers[0]].simplified] = common_reading
+	for numbers in pinyins.values():
+		numbers.sort(key=lambda number: rank(entries[number], entries[number].simplified, number,
+		                                     common_readings.get(entries[number].simplified)))
+	# keyword matches: mentioned in an earlier and shorter sense first, then shorter words first
+	keywords = {keyword: sorted(numbers, key=lambda number: (*numbers[number], len(entries[number].simplified), number))
+	            for keyword, numbers in keywords.items()}
+	# only words containing one of these need their reading looked up, all other hanzi always read the same
+	polyphones = {hanzi: headwords.get(hanzi, []) for hanzi, hanzi_readings in readings.items()
+	              if len(hanzi_readings) > 1 and is_hanzi(hanzi)}
+
+	records = [b"\0".join(value.encode("utf8") for value in (entry.traditional, entry.simplified, entry.pinyin,
+	                                                          "/".join(entry.senses))) for entry in entries]
+	offsets = [0]
+	for record in records:
+		offsets.append(offsets[-1] + len(record))
+
+	temp_index = index + ".tmp"
+	with open(temp_index, "wb") as f:
+		f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records), 0, 0, 0, 0))
+		f.write(uint32_bytes(offsets))
+		f.write(b"".join(records))
+		f.write(b"\0" * (-offsets[-1] % 4))
+		positions = [write_key_table(f, table) for table in (headwords, pinyins, keywords, polyphones)]
+		f.seek(0)
+		f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records), *positions))
+	os.replace(temp_index, index)
+	return len(records)
+
+
+def uint32_view(index_map, start, count):
+	"""Returns count uint32 values from the memory mapped index, without copying them on little endian machines"""
+	if sys.byteorder == "little":
+		return memoryview(index_map)[start:start + 4 * count].cast("I")
+	values = array("I", index_map[start:start + 4 * count])
+	values.byteswap()
+	return values
+
+
+class KeyTable:
+	"""Sorted keys with their entry numbers, read from a memory mapped index (see INDEX_MAGIC for the layout)"""
+
+	def __init__(self, index_map, position):
+		self._map = index_map
+		self._count = UINT32.unpack_from(index_map, position)[0]
+		self._key_offsets = uint32_view(index_map, position + 4, self._count + 1)
+		self._posting_offsets = uint32_view(index_map, position + 4 * (self._count + 2), self._count + 1)
+		self._keys_start = position + 8 * (self._count + 1) + 4
+		keys_end = self._keys_start + self._key_offsets[self._count]
+		self._postings = uint32_view(index_map, keys_end + (-keys_end % 4), self._posting_offsets[self._count])
+
+	def key(self, i):
+		"""Returns the encoded key number i"""
+		return self._map[self._keys_start + self._key_offsets[i]:self._keys_start + self._key_offsets[i + 1]]
+
+	def find(self, key):
+		"""Binary search for an encoded key. Returns the key number, or -1 if it is not in the table."""
+		low, high = 0, self._count
+		while low < high:
+			middle = (low + high) // 2
+			candidate = self.key(middle)
+			if candidate < key:
+				low = middle + 1
+			elif candidate > key:
+				high = middle
+			else:
+				return middle
+		return -1
+
+	def numbers(self, key):
+		"""Returns the entry numbers of a key (str), best match first; empty if the key is not in the table"""
+		i = self.find(key.encode("utf8"))
+		if i < 0:
+			return []
+		return self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]].tolist()
+
+	def __iter__(self):
+		for i in range(self._count):
+			yield self.key(i).decode("utf8")
+
+	def __len__(self):
+		return self._count
+
+	def release(self):
+		for view in (self._key_offsets, self._posting_offsets, self._postings):
+			if isinstance(view, memoryview):
+				view.release()
+
+
+class DictIndex(Mapping):
+	"""Read-only mapping of headword (simplified or traditional) -> translation, backed by a memory mapped index
+	file. The translation holds the senses of all entries of the headword, best match first. Opening the index is
+	O(1); entries are only decoded when they are looked up, and the lookups by pinyin and English keyword use the
+	prebuilt tables of the index. polyphones holds the hanzi with more than one reading."""
+
+	def __init__(self, index=DICTIONARY_INDEX):
+		with open(index, "rb") as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self._count, headwords, pinyins, keywords, polyphones = INDEX_HEADER.unpack_from(self._map, 0)
+		if magic != INDEX_MAGIC:
+			self._map.close()
+			raise ValueError(f"'{index}' is not a valid dictionary index.")
+		self._offsets = uint32_view(self._map, INDEX_HEADER.size, self._count + 1)
+		self._records_start = INDEX_HEADER.size + 4 * (self._count + 1)
+		self.headwords = KeyTable(self._map, headwords)
+		self.pinyins = KeyTable(self._map, pinyins)
+		self.keywords = KeyTable(self._map, keywords)
+		self.polyphones = KeyTable(self._map, polyphones)
+
+	def entry(self, number):
+		"""Decodes entry number number"""
+		start = self._records_start + self._offsets[number]
+		end = self._records_start + self._offsets[number + 1]
+		traditional, simplified, pinyin, senses = self._map[start:end].decode("utf8").split("\0")
+		return Entry(traditional, simplified, pinyin, tuple(senses.split("/")))
+
+	def entries(self, hanzi):
+		"""Returns all entries of a headword (simplified or traditional), best match first"""
+		return [self.entry(number) for number in self.headwords.numbers(hanzi)]
+
+	def by_pinyin(self, pinyin):
+		"""Returns all entries with the given pinyin, compared without tones and spaces (see toneless_pinyin)"""
+		return [self.entry(number) for number in self.pinyins.numbers(toneless_pinyin(pinyin))]
+
+	def by_keyword(self, text):
+		"""Returns the entries whose senses contain every keyword of an English text, best match first"""
+		keywords = [keyword for keyword in KEYWORD.findall(text.lower()) if keyword not in STOP_WORDS]
+		if len(keywords) == 0:
+			return []
+		numbers = self.keywords.numbers(keywords[0])
+		for keyword in keywords[1:]:
+			other = set(self.keywords.numbers(keyword))
+			numbers = [number for number in numbers if number in other]
+		return [self.entry(number) for number in numbers]
+
+	def __getitem__(self, hanzi):
+		numbers = self.headwords.numbers(hanzi) if isinstance(hanzi, str) else []
+		if len(numbers) == 0:
+			raise KeyError(hanzi)
+		senses = []
+		for number in numbers:
+			senses.extend(sense for sense in self.entry(number).senses if sense not in senses)
+		return "\n" + "\n".join(senses)
+
+	def __contains__(self, hanzi):
+		return isinstance(hanzi, str) and self.headwords.find(hanzi.encode("utf8")) >= 0
+
+	def __iter__(self):
+		return iter(self.headwords)
+
+	def __len__(self):
+		return len(self.headwords)
+
+	def close(self):
+		for table in (self.headwords, self.pinyins, self.keywords, self.polyphones):
+			table.release()
+		if isinstance(self._offsets, memoryview):
+			self._offsets.release()
+		self._map.close()
+
+
 class Dict:
-	def __init__(self):
-		self.words = {}
-		with open("res/cedict.itp", "r", encoding="utf8") as f:
-			data = f.read()
-			lines = data.splitlines()
-			for line in lines:
-				truncate_start = line[line.find(' ')+1:]
-				hanzi = truncate_start[:truncate_start.find(' ')]
-				trans = line[line.find("/"):-1].replace("/", "\n")
-				self.words[hanzi] = trans
-		print(f"Dictionary loaded into memory with {len(self.words)} entries.")
+	def __init__(self, source=DICTIONARY_SOURCE, index=DICTIONARY_INDEX):
+		if index_is_stale(source, index):
+			logger.info("Dictionary index missing or out of date, compiling...")
+			compile_index(source, index)
+		self.index = index
+		self.words = DictIndex(index)
+		logger.info(f"Dictionary loaded into memory with {len(self.words)} entries.")
 
 	def translate(self, hanzi):
+		metrics.count("dict.lookups")
 		if hanzi in self.words:
 			return self.words[hanzi]
 		return "_"
+
+	def lookup(self, hanzi):
+		"""Returns all entries of a word in simplified or traditional characters, best match first"""
+		metrics.count("dict.lookups")
+		return self.words.entries(hanzi)
+
+	def reverse_lookup(self, query):
+		"""Returns the entries matching a pinyin (with or without tones, e.g. 'zhong1guo2' or 'zhong guo') or, if
+		there are none, the entries whose senses contain every word of an English query (e.g. 'library')"""
+		metrics.count("dict.reverse_lookups")
+		return self.words.by_pinyin(query) or self.words.by_keyword(query)
@@ -0,0 +1,110 @@
+import logging
+import queue
+import threading
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InterpretationPipeline:
+    """
+    Computes interpretations in a worker thread, away from the tkinter main loop.
+
+    Texts submitted in quick succession (e.g. a phrase pasted by an IME) are debounced, so only the last one is
+    interpreted. Every submission gets a new generation number; results of older generations are stale and are
+    dropped both before and after they are computed. Finished results are handed back to the tkinter thread, which
+    picks them up through after() and only has to apply them.
+    """
+
+    def __init__(self, root, annotate, apply, debounce_ms=30, poll_ms=10, error_result=None):
+        """
+        Parameters
+        ----------
+        root : Tk
+            The tkinter root window, used for scheduling on the main loop
+        annotate : callable
+            Computes the result for a text. Runs in the worker thread, so it must not touch any widgets
+        apply : callable
+            Receives each finished result on the tkinter thread
+        debounce_ms : int, optional
+            How long the input has to be idle before a text is interpreted (default is 30)
+        poll_ms : int, optional
+            How often the tkinter thread checks for finished results while a request is pending (default is 10)
+        error_result : optional
+            Applied instead of the result if annotate raises an exception (default is None)
+        """
+        self.root = root
+        self.annotate = annotate
+        self.apply = apply
+        self.debounce_ms = debounce_ms
+        self.poll_ms = poll_ms
+        self.error_result = error_result
+        self.generation = 0
+        self.submitted = None  # time of the first keystroke not yet rendered
+        self.pending_dispatch = None
+        self.pending_poll = None
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = threading.Thread(target=self.run_worker, name="InterpretationPipeline", daemon=True)
+        self.worker.start()
+
+    def submit(self, text):
+        """Requests the interpretation of text, cancelling any request which has not been applied yet"""
+        self.generation += 1
+        if self.submitted is None:
+            self.submitted = time.perf_counter()
+        if self.pending_dispatch is not None:
+            self.root.after_cancel(self.pending_dispatch)
+        self.pending_dispatch = self.root.after(self.debounce_ms, self.dispatch, self.generation, text)
+
+    def dispatch(self, generation, text):
+        """Hands a debounced request over to the worker thread and starts waiting for its result"""
+        self.pending_dispatch = None
+        self.requests.put((generation, text))
+        if self.pending_poll is None:
+            self.pending_poll = self.root.after(self.poll_ms, self.poll)
+
+    def poll(self):
+        """Applies the result of the latest request once it is available. Runs on the tkinter thread."""
+        self.pending_poll = None
+        while not self.results.empty():
+            generation, result = self.results.get_nowait()
+            if generation == self.generation:
+                self.apply(result)
+                # measured from the first keystroke of a burst, so it includes the debounce delay
+                metrics.record("interpretation.keystroke_to_render", time.perf_counter() - self.submitted)
+                self.submitted = None
+                return
+        # keep waiting, unless a newer text is still being debounced (its dispatch starts polling again)
+        if self.pending_dispatch is None:
+            self.pending_poll = self.root.after(self.poll_ms, self.poll)
+
+    def run_worker(self):
+        """Worker thread: interprets the most recent request, skipping everything which is already stale"""
+        while True:
+            generation, text = self.requests.get()
+            if generation is None:
+                return
+            while not self.requests.empty():
+                generation, text = self.requests.get_nowait()
+                if generation is None:
+                    return
+            if generation != self.generation:
+                continue
+            try:
+                with metrics.timed("interpretation.annotate"):
+                    result = self.annotate(text)
+            except Exception:
+                # keep the worker alive; the next keystroke gets another try
+                logger.exception(f"Interpretation of '{text}' failed.")
+                metrics.count("interpretation.errors")
+                result = self.error_result
+            if generation == self.generation:
+                self.results.put((generation, result))
+
+    def close(self):
+        """Stops the worker thread"""
+        self.generation += 1
+        self.requests.put((None, None))
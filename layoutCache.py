@@ -0,0 +1,34 @@
+from lruCache import LruCache
+
+
+class LayoutCache:
+    """
+    Bounded LRU cache of laid out sentences (their lines of hanzi and pinyin) for the PDF creator, keyed by the
+    sentence and the layout settings it was laid out with. Kept for a whole session by the interpreter and by the
+    annotation server, so repeated saves of a growing session only lay out the new sentences. Thread safe.
+    """
+
+    def __init__(self, capacity=50000):
+        """
+        Parameters
+        ----------
+        capacity : int, optional
+            Maximum number of cached sentences (default is 50000)
+        """
+        self.cache = LruCache(capacity)
+
+    def get(self, sentence, layout_key, layout):
+        """Returns (lines, True) if the sentence was laid out with the same settings before, otherwise lays it out
+        by calling layout(sentence) and returns (lines, False)"""
+        laid_out = False
+
+        def compute(key):
+            nonlocal laid_out
+            laid_out = True
+            return layout(sentence)
+        lines = self.cache.get((sentence, layout_key), compute)
+        return lines, not laid_out
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size of the cache"""
+        return self.cache.stats()
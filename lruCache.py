@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+    """
+    Bounded, thread safe map which evicts the least recently used entries beyond its capacity, with hit/miss
+    counters. Values are computed outside of the lock, so a slow computation does not block other threads; None is a
+    valid value. Shared by the annotation cache, the layout cache and the pinyin resolver.
+    """
+
+    def __init__(self, capacity):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of entries
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def get(self, key, compute):
+        """Returns the value of the key, computing it by calling compute(key) and storing it if it is not cached"""
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = compute(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Adds or replaces an entry, evicting the least recently used ones beyond the capacity"""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def skip(self):
+        """Counts a lookup which was answered without the cache"""
+        with self.lock:
+            self.skipped += 1
+
+    def items(self):
+        """Returns a list of the (key, value) pairs, least recently used first"""
+        with self.lock:
+            return list(self.entries.items())
+
+    def clear(self):
+        """Removes all entries, keeping the counters"""
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size of the cache"""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "skipped": self.skipped, "size": len(self.entries), "capacity": self.capacity}
@@ -1,9 +1,35 @@
-from tkinter import Frame, Text, Message, Label, Entry, Button, Tk, StringVar, filedialog, END
+import time
+# Taken before all other imports, for the startup profile
+STARTUP_START = time.perf_counter()
+from tkinter import Frame, Text, Message, Label, Entry, Button, Tk, StringVar, filedialog
 from tkinter.font import Font
-import pinyin
-from pdfCreator import *
 from dict import Dict
+from segmenter import Segmenter
+from interpretationPipeline import InterpretationPipeline
+from annotationCache import AnnotationCache
+from annotationServer import AnnotationClient, AnnotationServerError, annotate_text
+from pinyinResolver import PinyinResolver
+from archive import ArchiveStore, ArchiveView
+from sessionJournal import SessionJournal
+from layoutCache import LayoutCache
+from charClassifier import classify, contains_hanzi, LATIN, DIGIT, SPACE
+from metrics import metrics
+from collections import deque
+import argparse
+import logging
 import os
+import sys
+import tempfile
+import threading
+
+IMPORTS_DONE = time.perf_counter()
+# Modules which are only imported on first use (saving a pdf, looking up pinyin missing from the annotation cache)
+DEFERRED_MODULES = ["reportlab", "pinyin"]
+
+logger = logging.getLogger(__name__)
+
+# Time budget for updating the live interpretation after a keystroke (one frame at 60 Hz)
+RENDER_LATENCY_BUDGET_MS = 16
 
 
 def hex_to_rgb(hex_color):
@@ -25,13 +51,25 @@ class Interpreter:
 
     @staticmethod
     def has_string_chinese_characters(string):
-        for c in string:
-            if ord(c) < 32 or ord(c) > 122:
-                return True
-        return False
-
-    def __init__(self):
-        """Sets up the tkinter window and prepares it for the user input."""
+        return contains_hanzi(string)
+
+    def __init__(self, run_mainloop=True, background_loading=True, profile_startup=False, metrics_file=None):
+        """Sets up the tkinter window and prepares it for the user input.
+
+        Parameters:
+            run_mainloop: Bool (optional)
+                Whether to enter the tkinter main loop. Disabled by scripts driving the window themselves (e.g. the
+                live view benchmark). Default: True
+            background_loading: Bool (optional)
+                Whether the dictionary is loaded in a background thread, so the window appears immediately and shows
+                a loading state until the dictionary is ready. Default: True
+            profile_startup: Bool (optional)
+                Whether to print a breakdown of the startup time once the first interpretation is shown, and close
+                the window. Default: False
+            metrics_file: str (optional)
+                JSON file the metrics (timers, counters, cache statistics) are written to when the window is closed.
+                They can also be shown on screen with F12. Default: None
+        """
         # Define colors
         self.bg_color = '#444444'
         self.fg_color = '#AAAAAA'
@@ -40,11 +78,43 @@ class Interpreter:
         self.enough_space_color = "#002200"
         self.crowded_color = "#662200"
         self.archive_bg_color = '#333333'
-        # Load the dictionary for character-per-character translation
-        self.dict = Dict()
-        # Set up variables for input text and live interpretation frame columns
+        # Use a running annotation server, which already has the dictionary loaded. Without one, the dictionary is
+        # loaded into this process.
+        self.dict = None
+        self.segmenter = None
+        self.pinyin_resolver = None
+        self.annotation_cache = None
+        self.local_annotation_lock = threading.Lock()
+        self.loading_error = None
+        self.profile_startup = profile_startup
+        self.metrics_file = metrics_file
+        self.metrics_overlay = None
+        self.startup_phases = {"imports": IMPORTS_DONE - STARTUP_START}
+        self.startup_milestones = {}
+        start = time.perf_counter()
+        self.annotation_client = AnnotationClient.connect()
+        self.startup_phases["annotation server connect"] = time.perf_counter() - start
+        if self.annotation_client:
+            logger.info("Connected to the annotation server.")
+        elif background_loading:
+            threading.Thread(target=self.load_dictionary_in_background, name="DictionaryLoader", daemon=True).start()
+        else:
+            self.load_local_annotation()
+        # Set up variables for input text and live interpretation frame columns. Columns are pooled: self.columns
+        # holds all columns created so far, the first self.visible_columns of them are currently shown, and
+        # self.column_words holds the word each column displays.
         self.columns = []
-        self.full_chinese_text = ""
+        self.column_words = []
+        self.visible_columns = 0
+        self.render_latencies = deque(maxlen=200)
+        # The archive is journaled, so a session survives a crash and is resumed on the next start. A session closed
+        # cleanly is kept under a timestamped name and not resumed.
+        self.session_journal = SessionJournal()
+        self.session_journal_sync = None
+        self.archive_store = ArchiveStore(self.session_journal)
+        # Repeated pdf exports of the growing session only lay out the new sentences
+        self.layout_cache = LayoutCache()
+        metrics.add_source("layout_cache", self.layout_cache.stats)
         # Create  and configure the tkinter root window
         self.root = Tk("Hanzi Interpreter")
         self.root.iconbitmap('res/icon.ico')
@@ -54,7 +124,8 @@ class Interpreter:
         self.root.geometry(f"{self.window_width}x800+100+100")
         self.root.configure(background=self.bg_color)
         self.root.bind('<Configure>', self.update_window_width)
-
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.hanzi_font = Font(family="Noto Serif SC SemiBold", size=70)
 
         # Populate the root window: Text Input
         self.input_content.set("你好")
@@ -73,6 +144,12 @@ class Interpreter:
         self.frame_live_interpretation = Frame(self.root, width=self.window_width,  borderwidth=0, bg=self.bg_color)
         self.frame_live_interpretation.grid(row=1, column=0, sticky = "nswe")
         self.frame_live_interpretation.grid_columnconfigure(0, weight=1)
+        self.message_waiting = Message(self.frame_live_interpretation,
+                                       text="Waiting for Chinese Text..." if self.annotation_ready() else
+                                       "Loading dictionary...",
+                                       bg=self.bg_color, fg=self.fg_color, padx=3, pady=5)
+        self.message_waiting.grid(row=0, column=0, padx=1, pady=1)
+        self.message_waiting.config(font=("Courier", 20))
 
         # Populate the root window: Archive
         self.frame_archive = Frame(self.root, width=self.window_width,  borderwidth=0)
@@ -85,11 +162,18 @@ class Interpreter:
         self.archive = Text(self.frame_archive, bg=self.archive_bg_color, fg=self.fg_color)
         self.archive.grid(row=1, column=0, sticky="ew")
         self.archive.config(state='disabled')
+        self.archive_view = ArchiveView(self.archive, self.archive_store)
+        if len(self.archive_store) > 0:
+            logger.info(f"Resuming the last session with {len(self.archive_store)} lines.")
+            self.archive_view.show_end()
 
         # Populate the root window: Save Button
         self.button_save_pdf = Button(self.frame_archive, text="Save Archive to File", command=self.save_to_file)
         self.button_save_pdf.grid(row=2, column=0, sticky="sew")
         self.button_save_pdf.config(font=("Courier", 40))
+        self.button_new_session = Button(self.frame_archive, text="New Session", command=self.new_session)
+        self.button_new_session.grid(row=3, column=0, sticky="sew")
+        self.button_new_session.config(font=("Courier", 16))
 
         self.frame_archive.grid_columnconfigure(0, weight=1)
 
@@ -98,9 +182,16 @@ class Interpreter:
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_rowconfigure(1, weight=1)
         self.root.grid_rowconfigure(2, weight=1)
+        self.interpretation_pipeline = InterpretationPipeline(self.root, self.annotate, self.apply_interpretation,
+                                                              error_result=[])
         self.text_changed(initial=True)
         self.root.update()
-        self.root.mainloop()
+        self.startup_milestones["window shown"] = time.perf_counter() - STARTUP_START
+        if not self.annotation_ready():
+            self.root.after(50, self.poll_annotation_ready)
+        self.finish_startup_profile()
+        if run_mainloop:
+            self.root.mainloop()
 
     def update_window_width(self, event):
         """Updates the self.window_width variable whenever the users changes the window size"""
@@ -134,83 +225,217 @@ class Interpreter:
         if initial:
             self.entry_chinese_text.configure(bg=self.enough_space_color)
         else:
-            column_width = self.window_width / (len(self.columns) + 1)
+            column_width = self.window_width / (max(self.visible_columns, 1) + 1)
             self.entry_chinese_text.configure(bg=self.get_color(column_width))
 
     def clear_frame_live_interpretation(self):
-        # Clear the live interpretation frame
-        for widget in self.frame_live_interpretation.winfo_children():
-            widget.destroy()
-        # Reset the grid configuration for the columns
-        for i in range(self.frame_live_interpretation.grid_size()[0]):
+        """Hides all columns of the live interpretation frame. The columns stay in the pool for reuse."""
+        self.hide_interpretation_columns(0)
+        self.visible_columns = 0
+
+    def hide_interpretation_columns(self, first):
+        """Hides the visible columns from index first onwards"""
+        for i in range(first, self.visible_columns):
+            for widget in self.columns[i]:
+                widget.grid_remove()
             self.frame_live_interpretation.grid_columnconfigure(i, weight=0)
-        # Clear the list of columns
-        self.columns = []
+
+    def load_local_annotation(self):
+        """Loads the dictionary, the segmenter and the annotation cache into this process (unless already done)"""
+        with self.local_annotation_lock:
+            if self.dict is not None:
+                return
+            start = time.perf_counter()
+            dictionary = Dict()
+            self.startup_phases["dictionary"] = time.perf_counter() - start
+            start = time.perf_counter()
+            self.segmenter = Segmenter(dictionary.words)
+            self.startup_phases["segmenter"] = time.perf_counter() - start
+            # Shared pinyin / translation cache, pre-warmed from the previous session or with the most frequent hanzi
+            start = time.perf_counter()
+            self.pinyin_resolver = PinyinResolver(dictionary)
+            self.annotation_cache = AnnotationCache(dictionary, resolver=self.pinyin_resolver)
+            if not self.annotation_cache.load(dictionary_index=dictionary.index):
+                threading.Thread(target=self.annotation_cache.warm, daemon=True).start()
+            self.startup_phases["annotation cache"] = time.perf_counter() - start
+            metrics.add_source("annotation_cache", self.annotation_cache.stats)
+            metrics.add_source("pinyin_resolver", self.pinyin_resolver.stats)
+            # set last: from here on, the local annotation is ready
+            self.dict = dictionary
+
+    def load_dictionary_in_background(self):
+        """Runs in the DictionaryLoader thread; a failure is reported by poll_annotation_ready"""
+        try:
+            self.load_local_annotation()
+        except Exception as e:
+            self.loading_error = e
+
+    def annotation_ready(self):
+        """Returns True once words can be annotated without waiting for the dictionary to load"""
+        return self.annotation_client is not None or self.dict is not None
+
+    def poll_annotation_ready(self):
+        """Leaves the loading state once the dictionary has been loaded in the background. If loading failed, the
+        error is shown and the input field is disabled."""
+        if self.loading_error is not None:
+            logger.error("Could not load the dictionary.", exc_info=self.loading_error)
+            self.message_waiting.config(text=f"Could not load the dictionary: {self.loading_error}")
+            self.entry_chinese_text.config(state="disabled")
+            return
+        if not self.annotation_ready():
+            self.root.after(50, self.poll_annotation_ready)
+            return
+        self.message_waiting.config(text="Waiting for Chinese Text...")
+        self.text_changed()
+
+    def annotate_parts(self, text, mode="words"):
+        """Returns (hanzi, pinyin, translation) for each dictionary word (mode 'words'), each character (mode
+        'characters') or the text as a whole (mode 'whole'). Uses the annotation server if connected; if it has gone
+        away (or does not answer in time), the dictionary is loaded locally instead."""
+        if self.annotation_client:
+            try:
+                return [tuple(part) for part in self.annotation_client.annotate([text], mode)[0]]
+            except OSError:
+                logger.warning("Lost the connection to the annotation server, loading the dictionary locally.")
+                self.annotation_client = None
+        # waits for the dictionary if it is still being loaded in the background
+        self.load_local_annotation()
+        return annotate_text(text, mode, self.segmenter, self.annotation_cache)
 
     def get_translation(self, hanzi):
         """Translate a Chinese character to English"""
-        english_translation_raw = self.dict.translate(hanzi)
-        english_translation = (english_translation_raw[1:40] + '...') if len(
-            english_translation_raw) > 75 else english_translation_raw[1:]
-        return english_translation
-
-    def make_interpretation_column(self, i, hanzi):
-        """Returns a single column for a single Chinese character, including Hanzi, Pinyin, and translation.
-            If there is no Chinese character, the column will contain a message"""
+        return self.annotate_parts(hanzi, "whole")[0][2]
+
+    def annotate(self, user_input):
+        """Splits the user input into Chinese words and looks up their pinyin and translation. Returns a list of
+        (hanzi, pinyin, translation) tuples. Does not touch any widgets, so it is safe to run in a worker thread."""
+        annotations = []
+        if Interpreter.has_string_chinese_characters(user_input):
+            for annotation in self.annotate_parts(user_input):
+                if Interpreter.has_string_chinese_characters(annotation[0]):
+                    annotations.append(annotation)
+        return annotations
+
+    def make_interpretation_column(self, i, annotation):
+        """Returns a single column for a single Chinese word, including Hanzi, Pinyin, and translation."""
+        hanzi, hanzi_pinyin, translation = annotation
         column = []
-        if len(hanzi) > 0:
-            # Create the column's upper part (Chinese character)
-            message_chinese = Message(self.frame_live_interpretation, text=hanzi, bg=self.bg_color,
-                                      fg=self.input_color, padx=30, pady=5)
-            message_chinese.config(font=Font(family="Noto Serif SC SemiBold", size=70))
-            message_chinese.grid(row=0, column=i, sticky="nsew", padx=1, pady=1)
-            # Create the column's middle part (Pinyin)
-            label_pinyin = Label(self.frame_live_interpretation, text=pinyin.get(hanzi), bg=self.bg_color,
-                                 fg=self.pinyin_color, padx=3, pady=5)
-            label_pinyin.grid(row=1, column=i, sticky="nsew", padx=1, pady=1)
-            label_pinyin.config(font=("Courier", 30))
-
-            # Create the column's bottom part (English translation)
-            message_english = Message(self.frame_live_interpretation, text=self.get_translation(hanzi),
-                                      bg=self.bg_color, fg=self.fg_color, padx=0, pady=5)
-            message_english.grid(row=2, column=i, padx=1, pady=1)
-            message_english.config(font=("Courier", 8))
-            # Populate the column with the newly created parts
-            column.append(message_chinese)
-            column.append(label_pinyin)
-            column.append(message_english)
-        else:
-            message_waiting = Message(self.frame_live_interpretation, text="Waiting for Chinese Text...",
-                                      bg=self.bg_color, fg=self.fg_color, padx=3, pady=5)
-            message_waiting.grid(row=0, column=0, padx=1, pady=1)
-            message_waiting.config(font=("Courier", 20))
-            column.append(message_waiting)
+        # Create the column's upper part (Chinese word)
+        message_chinese = Label(self.frame_live_interpretation, text=hanzi, bg=self.bg_color,
+                                fg=self.input_color, padx=30, pady=5)
+        message_chinese.config(font=self.hanzi_font)
+        message_chinese.grid(row=0, column=i, sticky="nsew", padx=1, pady=1)
+        # Create the column's middle part (Pinyin)
+        label_pinyin = Label(self.frame_live_interpretation, text=hanzi_pinyin, bg=self.bg_color,
+                             fg=self.pinyin_color, padx=3, pady=5)
+        label_pinyin.grid(row=1, column=i, sticky="nsew", padx=1, pady=1)
+        label_pinyin.config(font=("Courier", 30))
+
+        # Create the column's bottom part (English translation)
+        message_english = Message(self.frame_live_interpretation, text=translation,
+                                  bg=self.bg_color, fg=self.fg_color, padx=0, pady=5)
+        message_english.grid(row=2, column=i, padx=1, pady=1)
+        message_english.config(font=("Courier", 8))
+        # Populate the column with the newly created parts
+        column.append(message_chinese)
+        column.append(label_pinyin)
+        column.append(message_english)
         return column
 
+    def show_interpretation_column(self, i, annotation):
+        """Shows an annotated word in column i. Existing columns are reused and only reconfigured if their word has
+        changed; a new column is only created if the pool is exhausted."""
+        hanzi, hanzi_pinyin, translation = annotation
+        if i == len(self.columns):
+            self.columns.append(self.make_interpretation_column(i, annotation))
+            self.column_words.append(hanzi)
+        else:
+            if self.column_words[i] != hanzi:
+                message_chinese, label_pinyin, message_english = self.columns[i]
+                message_chinese.config(text=hanzi)
+                label_pinyin.config(text=hanzi_pinyin)
+                message_english.config(text=translation)
+                self.column_words[i] = hanzi
+            if i >= self.visible_columns:
+                for widget in self.columns[i]:
+                    widget.grid()
+        self.frame_live_interpretation.grid_columnconfigure(i, weight=1)
+
     def text_changed(self, *args, initial=False):
-        """updates the live interpretation frame"""
-        #print ("Text Changed-------------------------")
-        # first, remove previous columns
-        self.clear_frame_live_interpretation()
+        """Requests an update of the live interpretation frame. The lookups run in the interpretation pipeline's
+        worker thread; only the initial interpretation is done synchronously, so the window never starts empty."""
         user_input = self.entry_chinese_text.get()
-        if Interpreter.has_string_chinese_characters(user_input):
-            # if there are Chinese characters in the input field: rebuild all columns
-            for i, hanzi in enumerate(user_input):  # creates a new column for each Chinese character
-                if ord(hanzi) < 32 or ord(hanzi) > 122:
-                    column = self.make_interpretation_column(i, hanzi)
-                    self.columns.append(column)
+        if initial and not self.annotation_ready():
+            # show the loading state; poll_annotation_ready interprets the input once the dictionary is loaded
+            self.apply_interpretation([], initial=True)
+        elif initial:
+            self.apply_interpretation(self.annotate(user_input), initial=True)
         else:
-            # if there are no Chinese characters in the input field: display a message
-            column = self.make_interpretation_column(0, "")
-            self.columns.append(column)
-
-        # place all columns in the live interpretation frame
-        for j in range(len(self.columns)):
-            #print(f"arranging colum {j+1} of {len(self.columns)}")
-            self.frame_live_interpretation.grid_columnconfigure(j, weight=1)
+            self.interpretation_pipeline.submit(user_input)
+
+    def apply_interpretation(self, annotations, initial=False):
+        """updates the live interpretation frame, touching only the columns whose word has changed"""
+        start = time.perf_counter()
+        # show one column for each Chinese word, and hide the columns which are no longer needed
+        for i, annotation in enumerate(annotations):
+            self.show_interpretation_column(i, annotation)
+        self.hide_interpretation_columns(len(annotations))
+        self.visible_columns = len(annotations)
+
+        # if there are no Chinese characters in the input field: display a message
+        if len(annotations) > 0:
+            self.message_waiting.grid_remove()
+        else:
+            self.message_waiting.grid()
+            self.frame_live_interpretation.grid_columnconfigure(0, weight=1)
 
         # color the input field according to how full it is.
         self.set_color_according_to_input_length(initial)
+        self.record_render_latency(start)
+        if "first render" not in self.startup_milestones and self.annotation_ready():
+            self.startup_milestones["first render"] = time.perf_counter() - STARTUP_START
+            self.finish_startup_profile()
+
+    def finish_startup_profile(self):
+        """With profile_startup: prints how long each part of the startup took, and when the window and the first
+        interpretation were shown, then closes the window. Waits until both have been shown."""
+        if not self.profile_startup or len(self.startup_milestones) < 2:
+            return
+        self.profile_startup = False
+        print("\nStartup profile")
+        for phase, seconds in self.startup_phases.items():
+            print(f"  {phase:<28} {seconds * 1000:>8.1f} ms")
+        for milestone, seconds in sorted(self.startup_milestones.items(), key=lambda item: item[1]):
+            print(f"  {milestone + ' after':<28} {seconds * 1000:>8.1f} ms")
+        deferred = [module for module in DEFERRED_MODULES if module not in sys.modules]
+        print(f"  not imported yet: {', '.join(deferred) if deferred else '-'}\n")
+        self.root.after_idle(self.close)
+
+    def record_render_latency(self, start):
+        """Records how long the last update of the live interpretation took, and warns if it exceeded the budget"""
+        seconds = time.perf_counter() - start
+        latency_ms = seconds * 1000
+        self.render_latencies.append(latency_ms)
+        metrics.record("interpretation.render", seconds)
+        if latency_ms > RENDER_LATENCY_BUDGET_MS:
+            logger.warning(f"Live interpretation took {latency_ms:.1f} ms for {self.visible_columns} columns "
+                           f"(budget: {RENDER_LATENCY_BUDGET_MS} ms).")
+
+    def toggle_metrics_overlay(self):
+        """Shows or hides the metrics overlay in the top right corner of the window"""
+        if self.metrics_overlay is None:
+            self.metrics_overlay = Label(self.root, justify="left", anchor="ne", bg="#000000", fg="#88FF88",
+                                         font=("Courier", 10))
+            self.metrics_overlay.place(relx=1.0, rely=0.0, anchor="ne")
+            self.update_metrics_overlay()
+        else:
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+
+    def update_metrics_overlay(self):
+        if self.metrics_overlay is not None:
+            self.metrics_overlay.config(text=metrics.summary())
+            self.root.after(500, self.update_metrics_overlay)
 
     def select_text(self, event):
         """Selects all text in entry_chinese_text"""
@@ -218,35 +443,46 @@ class Interpreter:
         self.entry_chinese_text.icursor('end')
 
     def drop_current_line_to_archive(self):
-        """Clears the entry_chinese_text input field and adds its content to the archive below"""
+        """Clears the entry_chinese_text input field and adds its content to the archive below. Does nothing if the
+        dictionary could not be loaded."""
+        if self.loading_error is not None:
+            return
         user_input = self.entry_chinese_text.get()
-        print(f"Moving current line '{user_input}' to archive below.")
-        self.archive.config(state='normal')
-        self.full_chinese_text += user_input + "\n"
-        # Add the Chinese text
-
-        self.archive.insert(END, user_input)
-        self.archive.insert(END, "  -  ")
-
-        # Add the Pinyin
-        for hanzi in user_input:
-            if ord(hanzi) < 32 or ord(hanzi) > 122:
-                self.archive.insert(END, pinyin.get(hanzi) + " ")
-            else:
-                self.archive.insert(END, pinyin.get(hanzi))
-        self.archive.insert(END, "\n")
-        self.archive.see("end")
-        self.archive.config(state='disabled')
+        logger.debug(f"Moving current line '{user_input}' to archive below.")
+        start = time.perf_counter()
+        # Build the line's pinyin once; the archive view inserts the whole line with a single call
+        annotations = self.annotate_parts(user_input, "characters")
+        user_input_pinyin = "".join(hanzi_pinyin + " " if classify(hanzi) not in (LATIN, DIGIT, SPACE) else hanzi_pinyin
+                                    for hanzi, hanzi_pinyin, _ in annotations)
+        # the pinyin of every character is journaled as well, for the pdf export
+        character_pinyins = [hanzi_pinyin for _, hanzi_pinyin, _ in annotations]
+        self.archive_view.append(self.archive_store.append(user_input, user_input_pinyin, character_pinyins))
+        metrics.record("archive.drop_line", time.perf_counter() - start)
+        # The journal fsyncs in batches; make sure the last line of a burst is synced within a second as well
+        if self.session_journal_sync is None:
+            self.session_journal_sync = self.root.after(1000, self.sync_session_journal)
         # Clear input field and live interpretation frame.
         self.input_content.set("")
-        self.clear_frame_live_interpretation()
-        self.text_changed()
+
+    def sync_session_journal(self):
+        self.session_journal_sync = None
+        self.session_journal.sync()
+
+    def new_session(self):
+        """Ends the current session: its journal is kept under a timestamped name, and the archive is cleared"""
+        old_journal = self.session_journal.rotate()
+        if old_journal:
+            logger.info(f"The last session was kept in '{old_journal}'.")
+        self.archive_view.show_end()
 
     def key_pressed(self, event):
         """Checks if the user has pressed the enter key. If so, the text from the entry is moved to the archive frame.
-        Also, refocuses on the input field in case the user has clicked anywhere else on the window."""
+        F12 toggles the metrics overlay. Also, refocuses on the input field in case the user has clicked anywhere else
+        on the window."""
         if event.keysym == 'Return':
             self.drop_current_line_to_archive()
+        elif event.keysym == 'F12':
+            self.toggle_metrics_overlay()
         self.entry_chinese_text.focus()
 
 
@@ -260,17 +496,67 @@ class Interpreter:
                                                      filetypes=[("PDF Files", "*.pdf"), ("Text Files", "*.txt")])
         # Save file
         if save_location.endswith(".pdf"):
-            print("saving pdf....")
+            logger.info("saving pdf....")
             headline = os.path.splitext(os.path.basename(save_location))[0]
-            pdf_creator = PdfCreator(input_text=self.full_chinese_text, headline=headline, output_file=save_location)
+            if self.annotation_client:
+                # the server streams the session from a file, so the session is never held in memory as a whole
+                export_file, export_path = tempfile.mkstemp(suffix=".txt", prefix="session-")
+                try:
+                    with open(export_file, "w", encoding="utf8") as f:
+                        f.writelines(self.archive_store.chinese_lines())
+                    self.annotation_client.create_pdf(input_file=export_path, headline=headline,
+                                                      output_file=save_location, segment_words=True, stream=True)
+                    logger.info(f"The annotation server has written the pdf to '{save_location}'.")
+                    return
+                except (OSError, AnnotationServerError) as e:
+                    logger.warning(f"The annotation server could not create the pdf ({e}), creating it locally.")
+                    self.load_local_annotation()
+                finally:
+                    os.remove(export_path)
+            from pdfCreator import PdfCreator
+            pdf_creator = PdfCreator(annotated_lines=self.archive_store.annotated_lines(), headline=headline,
+                                     output_file=save_location, segmenter=self.segmenter,
+                                     annotation_cache=self.annotation_cache, layout_cache=self.layout_cache)
             pdf_creator.create_pdf()
         elif save_location.endswith(".txt"):
-            print("saving txt....")
+            logger.info("saving txt....")
             with open(save_location, "w+", encoding="utf8") as f:
-                f.write(self.archive.get("1.0", END))
+                f.writelines(self.archive_store.display_lines())
         else:
-            print("invalid file type")
+            logger.error("invalid file type")
+
+    def close(self):
+        """Persists the annotation cache for the next session, ends the session and closes the window"""
+        if self.annotation_client:
+            self.annotation_client.close()
+        if self.annotation_cache:
+            stats = self.annotation_cache.stats()
+            logger.info(f"Annotation cache: {stats['hits']} hits, {stats['misses']} misses "
+                        f"(hit rate {stats['hit_rate']:.1%}), {stats['size']} entries.")
+            try:
+                self.annotation_cache.save()
+            except OSError:
+                logger.warning("The annotation cache could not be saved.")
+        if self.session_journal_sync is not None:
+            self.root.after_cancel(self.session_journal_sync)
+        old_journal = self.session_journal.end_session()
+        if old_journal:
+            logger.info(f"The session was kept in '{old_journal}'.")
+        if self.metrics_file:
+            metrics.dump(self.metrics_file)
+            logger.info(f"Metrics written to '{self.metrics_file}'.")
+        self.interpretation_pipeline.close()
+        self.root.destroy()
 
 
 if __name__ == '__main__':
-    interpreter = Interpreter()
+    parser = argparse.ArgumentParser(description='Live interpreter for Chinese text.')
+    parser.add_argument('--profile-startup', '--profile_startup', dest='profile_startup', action='store_true',
+                        help='Print how long the imports, the dictionary and the first interpretation took, then exit')
+    parser.add_argument('--log_level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='DEBUG also logs every archived line')
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help='JSON file to write the metrics to on exit (set HANZI_METRICS=off to disable them)')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    interpreter = Interpreter(profile_startup=args.profile_startup, metrics_file=args.metrics_file)
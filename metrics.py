@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Set HANZI_METRICS=off to start with metrics disabled
+METRICS_ENVIRONMENT_VARIABLE = "HANZI_METRICS"
+
+
+class Timer:
+    """Statistics of one timed stage: count, total, maximum and a window of recent samples for the percentiles"""
+
+    def __init__(self, sample_count):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_count)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def stats(self):
+        """Returns the statistics in milliseconds. The percentiles are taken from the recent samples."""
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000 if samples else 0.0
+        return {"count": self.count, "total_ms": self.total * 1000,
+                "mean_ms": self.total * 1000 / self.count if self.count else 0.0, "max_ms": self.max * 1000,
+                "p50_ms": percentile(0.5), "p95_ms": percentile(0.95)}
+
+
+class Stopwatch:
+    """Context manager recording the time spent in its block as a sample of a timer"""
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class NullStopwatch:
+    """Stands in for Stopwatch while metrics are disabled; does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STOPWATCH = NullStopwatch()
+
+
+class Metrics:
+    """
+    Lightweight, thread safe metrics registry: per-stage timers, counters and gauges, plus sources (callables
+    returning a dict, e.g. AnnotationCache.stats) which are only queried when a snapshot is taken, so the caches do
+    not pay anything on their hot paths.
+
+    While disabled, every call returns immediately without taking the time or a lock; hot loops can additionally
+    check metrics.enabled themselves.
+    """
+
+    def __init__(self, enabled=True, sample_count=1000):
+        """
+        Parameters
+        ----------
+        enabled : bool, optional
+            Whether metrics are collected (default is True)
+        sample_count : int, optional
+            How many recent samples each timer keeps for its percentiles (default is 1000)
+        """
+        self.enabled = enabled
+        self.sample_count = sample_count
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+        self.sources = {}
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        """Adds a sample (in seconds) to a timer"""
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = Timer(self.sample_count)
+            timer.add(seconds)
+
+    def timed(self, name):
+        """Returns a context manager which records the time spent in its block, e.g. with metrics.timed('pdf.save'):"""
+        return Stopwatch(self, name) if self.enabled else NULL_STOPWATCH
+
+    def gauge(self, name, value):
+        """Sets a value which is reported as it is, e.g. a rate"""
+        if self.enabled:
+            self.gauges[name] = value
+
+    def add_source(self, name, stats):
+        """Registers a callable returning a dict of statistics, queried for every snapshot"""
+        self.sources[name] = stats
+
+    def snapshot(self):
+        """Returns all metrics as a JSON serializable dict"""
+        with self.lock:
+            snapshot = {"enabled": self.enabled, "uptime": time.time() - self.started,
+                        "counters": dict(self.counters),
+                        "timers": {name: timer.stats() for name, timer in self.timers.items()},
+                        "gauges": dict(self.gauges)}
+        snapshot["sources"] = {name: stats() for name, stats in list(self.sources.items())}
+        return snapshot
+
+    def summary(self):
+        """Returns a short, human readable summary, one metric per line (e.g. for an on-screen overlay)"""
+        snapshot = self.snapshot()
+        if not self.enabled:
+            return "metrics off"
+        lines = [f"{name}: {stats['mean_ms']:.1f} ms mean, {stats['p95_ms']:.1f} ms p95 ({stats['count']}x)"
+                 for name, stats in sorted(snapshot["timers"].items())]
+        lines += [f"{name}: {value}" for name, value in sorted(snapshot["counters"].items())]
+        lines += [f"{name}: {value:.1f}" for name, value in sorted(snapshot["gauges"].items())]
+        for name, stats in sorted(snapshot["sources"].items()):
+            if "hit_rate" in stats:
+                lines.append(f"{name}: {stats['hit_rate']:.1%} hits, {stats['size']} entries")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Writes a snapshot to a JSON file"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.gauges.clear()
+
+
+# The process wide registry used by all modules
+metrics = Metrics(enabled=os.environ.get(METRICS_ENVIRONMENT_VARIABLE, "on").lower() != "off")
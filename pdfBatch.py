@@ -0,0 +1,168 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdfCreator import PdfCreator, register_fonts
+
+logger = logging.getLogger(__name__)
+
+# Stored in the output directory; remembers mtime and content hash of every input rendered so far
+BATCH_STATE_FILE = ".pdf_batch_state.json"
+
+# Annotation cache and segmenter of a worker process rendering with segment_words, see render_pdf
+worker_annotation_cache = None
+worker_segmenter = None
+
+
+def find_input_files(batch_input):
+    """
+    Resolves the batch input into a list of text files.
+
+    Parameters
+    ----------
+    batch_input : str
+        Either a directory (all .txt files in it), a manifest file (one text file per line, relative paths are
+        relative to the manifest; empty lines and lines starting with # are ignored), or a glob pattern
+    """
+    if os.path.isdir(batch_input):
+        return sorted(glob.glob(os.path.join(batch_input, "*.txt")))
+    if os.path.isfile(batch_input):
+        manifest_dir = os.path.dirname(batch_input)
+        with open(batch_input, "r", encoding="utf8") as f:
+            lines = [line.strip() for line in f]
+        return [os.path.join(manifest_dir, line) for line in lines if len(line) > 0 and not line.startswith("#")]
+    return sorted(glob.glob(batch_input, recursive=True))
+
+
+def output_files(input_files, output_dir):
+    """
+    Returns {output file: input file}. The PDFs mirror the input files' paths relative to their common directory, so
+    texts of the same name in different folders (e.g. lessons/a/l1.txt and lessons/b/l1.txt) get PDFs of their own;
+    texts which are all in one folder keep their plain names. Texts listed twice are rendered once.
+    """
+    input_files = list(dict.fromkeys(os.path.abspath(input_file) for input_file in input_files))
+    if len(input_files) == 0:
+        return {}
+    common_dir = os.path.commonpath([os.path.dirname(input_file) for input_file in input_files])
+    return {os.path.join(output_dir, os.path.splitext(os.path.relpath(input_file, common_dir))[0] + ".pdf"): input_file
+            for input_file in input_files}
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def is_up_to_date(input_file, output_file, options, state):
+    """
+    Checks whether output_file was rendered from the current content of input_file with the same options. The
+    content is only hashed if the input's mtime has changed since the last run. Returns (up to date, state entry).
+    """
+    entry = state.get(output_file)
+    if not os.path.exists(output_file) or entry is None or entry["options"] != options:
+        return False, None
+    mtime = os.path.getmtime(input_file)
+    if entry["mtime"] == mtime:
+        return True, entry
+    content_hash = hash_file(input_file)
+    if entry["sha256"] == content_hash:
+        # touched, but not changed
+        return True, {"mtime": mtime, "sha256": content_hash, "options": options}
+    return False, None
+
+
+def render_pdf(input_file, output_file, options):
+    """Renders a single text to a PDF. Runs in a worker process. Returns (status, seconds, error message)."""
+    global worker_annotation_cache, worker_segmenter
+    start = time.perf_counter()
+    try:
+        options = dict(options)
+        if options.pop("segment_words") and worker_segmenter is None:
+            # loaded once per worker process, for all the texts it renders
+            from dict import Dict
+            from segmenter import Segmenter
+            from annotationCache import AnnotationCache
+            from pinyinResolver import PinyinResolver
+            dictionary = Dict()
+            worker_segmenter = Segmenter(dictionary.words)
+            worker_annotation_cache = AnnotationCache(resolver=PinyinResolver(dictionary))
+        if worker_segmenter is not None:
+            options.update(segmenter=worker_segmenter, annotation_cache=worker_annotation_cache)
+        headline = os.path.splitext(os.path.basename(input_file))[0]
+        pdf_creator = PdfCreator(input_file=input_file, headline=headline, output_file=output_file, **options)
+        pdf_creator.create_pdf()
+    except Exception as e:
+        return "failed", time.perf_counter() - start, str(e)
+    # set once the pdf has been saved; an older pdf of the same name does not count
+    if not hasattr(pdf_creator, "output_size"):
+        return "failed", time.perf_counter() - start, "no output written (empty input?)"
+    return "rendered", time.perf_counter() - start, None
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, BATCH_STATE_FILE), "r", encoding="utf8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, BATCH_STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def create_pdfs_in_batch(batch_input, output_dir=".", workers=None, force=False, new_line_for_sentence=False,
+                         large_text=False, output_profile="default", segment_words=False, stream=False):
+    """
+    Renders every text of the batch input to its own PDF in output_dir, distributed over a pool of worker
+    processes. Texts whose PDF is up to date (same content and options as in the last run) are skipped.
+    Returns a dict of counts per status.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    options = {"new_line_for_sentence": new_line_for_sentence, "large_text": large_text,
+               "output_profile": output_profile, "segment_words": segment_words, "stream": stream}
+    state = load_state(output_dir)
+    summary = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    # Work out which texts need rendering
+    jobs = {}
+    input_files = output_files(find_input_files(batch_input), output_dir)
+    for output_file, input_file in input_files.items():
+        up_to_date, entry = (False, None) if force else is_up_to_date(input_file, output_file, options, state)
+        if up_to_date:
+            state[output_file] = entry
+            summary["skipped"] += 1
+        else:
+            jobs[output_file] = input_file
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    logger.info(f"Batch: {len(input_files)} texts found, {summary['skipped']} up to date, {len(jobs)} to render.")
+
+    # Render them in parallel; fonts are registered once per worker process
+    if len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=register_fonts,
+                                 initargs=(output_profile,)) as executor:
+            futures = {executor.submit(render_pdf, input_file, output_file, options): output_file
+                       for output_file, input_file in jobs.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                output_file = futures[future]
+                input_file = jobs[output_file]
+                status, seconds, error = future.result()
+                summary[status] += 1
+                if status == "rendered":
+                    state[output_file] = {"mtime": os.path.getmtime(input_file), "sha256": hash_file(input_file),
+                                          "options": options}
+                logger.info(f"[{done}/{len(jobs)}] {input_file} -> {output_file}: {status} in {seconds:.2f}s"
+                            + (f" ({error})" if error else ""))
+    save_state(output_dir, state)
+
+    logger.info(f"Batch finished in {time.perf_counter() - start:.2f}s: {summary['rendered']} rendered, "
+                f"{summary['skipped']} skipped (up to date), {summary['failed']} failed.")
+    return summary
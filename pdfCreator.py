@@ -1,3 +1,4 @@
+from reportlab import rl_config
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
@@ -5,7 +6,76 @@ from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from reportlab.pdfbase.ttfonts import TTFont
 import re
 import argparse
-import pinyin as pinyin_library
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dict import Dict
+from segmenter import Segmenter
+from annotationCache import AnnotationCache
+from pinyinResolver import PinyinResolver
+from annotationServer import AnnotationClient, AnnotationServerError
+from charClassifier import classify_string, HANZI, SPACE
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Annotation cache and segmenter of a worker process of the parallel annotation pre-pass, see annotate_sentences
+worker_annotation_cache = None
+worker_segmenter = None
+
+# Output profiles. The hanzi are always set in the STSong-Light CID font, which pdf readers provide themselves, so the
+# pinyin font is the only font embedded into the pdf.
+OUTPUT_PROFILES = {
+    # reportlab's defaults: compressed page streams stored as ASCII85 text, pinyin font subsets keep ascii characters
+    # at their own codes
+    "default": {"page_compression": 1, "ascii85": True, "pinyin_font": "Noto"},
+    # smallest files: compressed binary streams, and pinyin font subsets contain only the glyphs actually used
+    "compact": {"page_compression": 1, "ascii85": False, "pinyin_font": "NotoCompact"},
+    # fastest rendering: page streams are written uncompressed, no ASCII85 encoding
+    "fast": {"page_compression": 0, "ascii85": False, "pinyin_font": "Noto"},
+}
+PINYIN_FONTS = {"Noto": {"asciiReadable": True}, "NotoCompact": {"asciiReadable": False}}
+
+# Fonts are registered with reportlab once per process (e.g. once per worker of a batch run)
+registered_fonts = set()
+
+
+def register_fonts(output_profile="default"):
+    """Registers the pinyin and hanzi fonts of an output profile with reportlab, unless this process has already
+    done so"""
+    pinyin_font = OUTPUT_PROFILES[output_profile]["pinyin_font"]
+    if pinyin_font not in registered_fonts:
+        pdfmetrics.registerFont(TTFont(pinyin_font, 'res/NotoSansSC-Medium.ttf', **PINYIN_FONTS[pinyin_font]))
+        registered_fonts.add(pinyin_font)
+    if 'STSong-Light' not in registered_fonts:
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+        registered_fonts.add('STSong-Light')
+
+
+def sentence_pinyins(sentence, categories, annotation_cache, words=None):
+    """Returns the pinyin of every character of a sentence: only hanzi get pinyin, all other characters a blank. Given
+    the sentence's words, each hanzi is read in the context of its word."""
+    if words is None:
+        return [annotation_cache.pinyin(hanzi) if category == HANZI else " "
+                for hanzi, category in zip(sentence, categories)]
+    return [pinyin if category == HANZI else " "
+            for pinyin, category in zip(annotation_cache.text_pinyins(words), categories)]
+
+
+def annotate_sentences(sentences, resolve_words=False):
+    """Runs in a worker process of the parallel annotation pre-pass: returns the pinyins of each sentence. With
+    resolve_words, the worker loads the dictionary once, to read the hanzi in the context of their words."""
+    global worker_annotation_cache, worker_segmenter
+    if worker_annotation_cache is None:
+        dictionary = Dict() if resolve_words else None
+        worker_segmenter = Segmenter(dictionary.words) if dictionary else None
+        worker_annotation_cache = AnnotationCache(resolver=PinyinResolver(dictionary) if dictionary else None)
+    return [sentence_pinyins(sentence, classify_string(sentence), worker_annotation_cache,
+                             worker_segmenter.segment(sentence) if worker_segmenter else None)
+            for sentence in sentences]
 
 
 class PdfCreator:
@@ -14,7 +84,10 @@ class PdfCreator:
     """
 
     def __init__(self, input_file=None, input_text="", headline="", output_file='OutputFile',
-                 new_line_for_sentence=False, large_text=False):
+                 new_line_for_sentence=False, large_text=False, segmenter=None,
+                 annotation_cache=None, input_lines=None, stream=False, batch_drawing=True,
+                 output_profile="default", layout_cache=None, annotation_workers=1, annotation_chunk_size=64,
+                 annotated_lines=None):
         """
         The PDF Creator initializes with either an input file or an input text, as well as several optional parameters.
         __init__ sets up the pdf canvas and page measurements.
@@ -30,24 +103,71 @@ class PdfCreator:
                 Whether a new line should be automatically added whenever a new sentence starts. Default: False
             large_text: Bool (optional)
                 Whether the text should be extra large for increased visibility
+            segmenter: Segmenter (optional)
+                If given, the text is split into dictionary words, and words are never broken across two lines
+            annotation_cache: AnnotationCache (optional)
+                Cache used for the pinyin, e.g. the one shared with the interpreter. By default a new one is created.
+                Together with a segmenter, a cache with a PinyinResolver reads polyphones in the context of their word
+            input_lines: iterable of str (optional)
+                Streaming input: the text is consumed line by line while the pdf is created, instead of being held in
+                memory as a whole. Used instead of input_file and input_text
+            stream: Bool (optional)
+                Whether the input file should be streamed line by line instead of being read completely. Keeps the
+                memory use bounded for very large texts. Default: False
+            batch_drawing: Bool (optional)
+                Whether each line is drawn with one text object per font, instead of setting font and colour and
+                drawing a centred string for every single glyph. Default: True
+            output_profile: str (optional)
+                One of OUTPUT_PROFILES: 'default', 'compact' (smallest files) or 'fast' (fastest rendering).
+                Default: 'default'
+            layout_cache: LayoutCache (optional)
+                Incremental export: sentences found in the cache with the same layout settings are not laid out
+                again. Keep the same cache for repeated exports of a growing text
+            annotation_workers: int (optional)
+                Number of worker processes annotating the sentences in parallel, ahead of the (sequential) layout and
+                drawing. 1 annotates in this process. Worth it for large documents only. Default: 1
+            annotation_chunk_size: int (optional)
+                Number of sentences handed to a worker process at once. Default: 64
+            annotated_lines: iterable of (str, list) (optional)
+                Streaming input which has been annotated already, e.g. the interpreter's archive: each line with the
+                pinyin of every character (or None, to look it up). Used instead of input_file and input_text
         """
-        print("\n...PDF Creator launched...\n")
+        logger.info("...PDF Creator launched...")
         self.input_text = input_text
+        self.input_lines = input_lines
+        self.annotated_lines = annotated_lines
+        self.streamed_file = None
         if input_file:
             try:
-                with open(input_file, "r", encoding="utf8") as in_file:
-                    self.input_text = in_file.read()
-                    print("Text file found. Text loaded.\n")
+                if stream:
+                    self.streamed_file = open(input_file, "r", encoding="utf8")
+                    self.input_lines = self.streamed_file
+                    logger.info("Text file found. Text will be streamed.")
+                else:
+                    with open(input_file, "r", encoding="utf8") as in_file:
+                        self.input_text = in_file.read()
+                        logger.info("Text file found. Text loaded.")
             except (FileNotFoundError, IsADirectoryError, PermissionError):
-                print("The file you indicated does not seem to exist, or is not a valid text file.\n")
+                logger.error("The file you indicated does not seem to exist, or is not a valid text file.")
+        elif input_lines is not None or annotated_lines is not None:
+            logger.info("Input lines will be streamed.")
         elif len(input_text) > 0:
-            print("Input text loaded.\n")
+            logger.info("Input text loaded.")
         else:
-            print("No valid input text available!\n")
+            logger.warning("No valid input text available!")
         self.headline = headline
         self.output_file = output_file
         self.new_line_for_sentence = new_line_for_sentence
-        self.ignore_for_pinyin = "：。，！；’【0123456789’、】【/@#……&*（）()——-=+“”？:;"
+        self.segmenter = segmenter
+        self.annotation_cache = annotation_cache if annotation_cache else AnnotationCache()
+        self.batch_drawing = batch_drawing
+        self.line_glyphs = []  # (x position of the glyph's centre, hanzi, pinyin) of the current line
+        self.text_widths = {}  # (text, font, size) -> width
+        self.layout_cache = layout_cache
+        self.annotation_workers = annotation_workers
+        self.annotation_chunk_size = annotation_chunk_size
+        self.layout_seconds = 0.0
+        self.layout_counts = {"laid out": 0, "reused": 0}
 
         # Initialize text measurements
         self.chars_per_line = 24
@@ -58,6 +178,9 @@ class PdfCreator:
         self.pinyin_offset = .5 * cm
         if large_text:
             self.init_large_text()
+        # everything a sentence's line breaks and pinyin depend on
+        self.resolve_words = self.segmenter is not None and self.annotation_cache.resolver is not None
+        self.layout_key = (self.chars_per_line, large_text, self.segmenter is not None, self.resolve_words)
 
         # Initialize page measurements
         self.page_height = 29.7 * cm
@@ -67,12 +190,14 @@ class PdfCreator:
         self.border_bottom = 1.7 * cm
         self.x_on_page = self.border_side
         self.y_on_page = self.border_top
-        self.canvas = Canvas(self.output_file, pagesize=(self.page_width, self.page_height))
+        self.output_profile = output_profile
+        self.pinyin_font = OUTPUT_PROFILES[output_profile]["pinyin_font"]
+        self.canvas = Canvas(self.output_file, pagesize=(self.page_width, self.page_height),
+                             pageCompression=OUTPUT_PROFILES[output_profile]["page_compression"])
         self.canvas.setTitle(self.headline)
 
         # Initialize fonts
-        pdfmetrics.registerFont(TTFont('Noto', 'res/NotoSansSC-Medium.ttf'))
-        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+        register_fonts(output_profile)
         self.font_color_hanzi = (.2, .2, .5)
         self.font_color_pinyin = (.6, .6, .6)
 
@@ -87,11 +212,13 @@ class PdfCreator:
 
     def next_line(self):
         """ Advances to a new line on the pdf canvas"""
+        self.flush_line()
         self.y_on_page += self.line_height
         self.x_on_page = self.border_side
 
     def next_page(self):
         """ Adds a new page to the pdf document """
+        self.flush_line()
         self.canvas.showPage()
         self.y_on_page = self.border_top
         self.x_on_page = self.border_side
@@ -117,82 +244,267 @@ class PdfCreator:
             self.canvas.drawCentredString(x_pos, y_pos, text)
         else:
             self.canvas.setFillColorRGB(*self.font_color_pinyin)
-            self.canvas.setFont("Noto", self.pinyin_size)
+            self.canvas.setFont(self.pinyin_font, self.pinyin_size)
             self.canvas.drawCentredString(x_pos, y_pos - self.pinyin_offset, text)
 
+    def get_text_width(self, text, font, size):
+        """Returns the width of a text on the canvas. Widths are cached, as the same glyphs recur constantly."""
+        key = (text, font, size)
+        width = self.text_widths.get(key)
+        if width is None:
+            width = pdfmetrics.stringWidth(text, font, size)
+            self.text_widths[key] = width
+        return width
+
+    def queue_onto_canvas(self, hanzi, pinyin):
+        """Queues a hanzi and its pinyin for the current position of the current line. The line is drawn as a whole
+        by flush_line, or directly glyph by glyph if batch drawing is disabled."""
+        if self.batch_drawing:
+            self.line_glyphs.append((self.x_on_page + self.char_width * 0.5, hanzi, pinyin))
+        else:
+            self.write_onto_canvas(hanzi, True)
+            self.write_onto_canvas(pinyin, False)
+
+    def flush_line(self):
+        """
+        Draws the queued glyphs of the current line: one text object for all hanzi and one for all pinyin, so font
+        and colour are only set once per line. Consecutive hanzi of equal width are drawn as a single string, using
+        the character spacing to place them exactly one char_width apart; pinyin syllables differ in width and are
+        positioned one by one.
+        """
+        if len(self.line_glyphs) == 0:
+            return
+        y_pos = self.page_height - self.y_on_page
+
+        # Glyph positions are given relative to the previous one (Td), which is shorter than absolute positions (Tm)
+        hanzi_text = self.canvas.beginText(self.border_side, y_pos)
+        hanzi_text.setFont('STSong-Light', self.hanzi_size)
+        hanzi_text.setFillColorRGB(*self.font_color_hanzi)
+        run_start = 0
+        while run_start < len(self.line_glyphs):
+            x_pos, hanzi, _ = self.line_glyphs[run_start]
+            width = self.get_text_width(hanzi, 'STSong-Light', self.hanzi_size)
+            run_end = run_start + 1
+            while run_end < len(self.line_glyphs) and \
+                    self.get_text_width(self.line_glyphs[run_end][1], 'STSong-Light', self.hanzi_size) == width:
+                run_end += 1
+            hanzi_text.setCharSpace(self.char_width - width)
+            hanzi_text.moveCursor(x_pos - width / 2 - hanzi_text.getStartOfLine()[0], 0)
+            hanzi_text.textOut("".join(glyph[1] for glyph in self.line_glyphs[run_start:run_end]))
+            run_start = run_end
+        self.canvas.drawText(hanzi_text)
+
+        pinyin_text = self.canvas.beginText(self.border_side, y_pos - self.pinyin_offset)
+        pinyin_text.setFont(self.pinyin_font, self.pinyin_size)
+        pinyin_text.setFillColorRGB(*self.font_color_pinyin)
+        for x_pos, _, pinyin in self.line_glyphs:
+            if len(pinyin.strip()) > 0:
+                pinyin_text.moveCursor(x_pos - self.get_text_width(pinyin, self.pinyin_font, self.pinyin_size) / 2
+                                       - pinyin_text.getStartOfLine()[0], 0)
+                pinyin_text.textOut(pinyin)
+        self.canvas.drawText(pinyin_text)
+        self.line_glyphs = []
+
     def place_headline_on_canvas(self):
         """ Puts the headline at the top of page 1 of the pdf canvas"""
         self.write_onto_canvas(self.headline, True, is_filename=True)
         self.next_line()
 
-    def place_sentence_on_canvas(self, sentence):
+    def layout_sentence(self, sentence, pinyins=None):
         """
-        Takes in a single Chinese sentence, adds the pinyin, and places both onto the pdf canvas
+        Adds the pinyin to a sentence and breaks it into lines. Every sentence starts on a new line, so its line
+        breaks do not depend on where it is placed. Returns a tuple of lines, each a tuple of (hanzi, pinyin).
+        pinyins (one per character, see sentence_pinyins) are looked up unless given by the annotation pre-pass.
+        """
+        # extract hanzi and pinyin from sentence; spaces are dropped, only hanzi get pinyin (not numbers,
+        # punctuation, latin letters etc.). The sentence is classified once, in a single pass.
+        categories = classify_string(sentence)
+        words = self.segmenter.segment(sentence) if self.segmenter else sentence
+        if pinyins is None:
+            pinyins = sentence_pinyins(sentence, categories, self.annotation_cache,
+                                       words if self.resolve_words else None)
+        lines = []
+        line = []
+        position = 0
+        for word in words:
+            end = position + len(word)
+            word = [(sentence[i], pinyins[i]) for i in range(position, end) if categories[i] != SPACE]
+            position = end
+            for i, glyph in enumerate(word):
+                # Check for new line; a word which does not fit into the current line starts a new one
+                if len(line) >= self.chars_per_line - 1 or \
+                        (i == 0 and len(line) > 0 and len(line) + len(word) > self.chars_per_line - 1):
+                    lines.append(tuple(line))
+                    line = []
+                line.append(glyph)
+        if len(line) > 0:
+            lines.append(tuple(line))
+        return tuple(lines)
+
+    def place_sentence_on_canvas(self, sentence, pinyins=None):
+        """
+        Takes in a single Chinese sentence, adds the pinyin, and places both onto the pdf canvas. With a layout
+        cache, sentences which were laid out before (e.g. in an earlier save of the same session) are reused.
         Parameters
         ----------
         sentence: str
             The sentence to be placed onto the pdf canvas
+        pinyins: list (optional)
+            The pinyin of every character of the sentence, if already known from the annotation pre-pass
         """
         if len(sentence) > 0:
-            print("Working on Sentence:", sentence)
-            pos_in_sentence = 0
-            pos_in_line = 0
-
-            # extract hanzi and pinyin from sentence; ignore except numbers, punctuation etc.
-            sentence_hanzis = []
-            sentence_pinyins = []
-            for hanzi in sentence:
-                if len(hanzi) > 0 and hanzi not in "  ":
-                    pinyin = " " if hanzi in self.ignore_for_pinyin else pinyin_library.get(hanzi)
-                    sentence_hanzis.append(hanzi)
-                    sentence_pinyins.append(pinyin)
-
-            # write hanzi and pinyin onto the pdf canvas
-            while pos_in_sentence < len(sentence_hanzis):
-
-                # Check for new line / new page
-                if pos_in_line >= self.chars_per_line - 1:
+            logger.debug("Working on Sentence: %s", sentence)
+            layout_start = time.perf_counter()
+            if self.layout_cache is not None:
+                lines, cached = self.layout_cache.get(sentence, self.layout_key,
+                                                      lambda sentence: self.layout_sentence(sentence, pinyins))
+            else:
+                lines, cached = self.layout_sentence(sentence, pinyins), False
+            self.layout_seconds += time.perf_counter() - layout_start
+            self.layout_counts["reused" if cached else "laid out"] += 1
+
+            # write hanzi and pinyin onto the pdf canvas, starting a new page when needed
+            for i, line in enumerate(lines):
+                if i > 0:
                     self.next_line()
-                    pos_in_line = 0
                     if self.y_on_page > self.page_height - self.border_bottom:
                         self.next_page()
-
-                # Write onto canvas
-                self.write_onto_canvas(sentence_hanzis[pos_in_sentence], True)
-                self.write_onto_canvas(sentence_pinyins[pos_in_sentence], False)
-
-                # Advance positions
-                pos_in_sentence += 1
-                pos_in_line += 1
-                self.x_on_page += self.char_width
+                for hanzi, pinyin in line:
+                    self.queue_onto_canvas(hanzi, pinyin)
+                    self.x_on_page += self.char_width
 
             # Finalize writing sentence
             self.next_line()
             if self.y_on_page > 27 * cm:
                 self.next_page()
 
+    def iter_sentences(self):
+        """
+        Yields the non-empty portions of the input text (lines, or sentences if new_line_for_sentence is set). Streamed
+        input is split line by line, so only the current line is held in memory.
+        """
+        split_triggers = '。|\n' if self.new_line_for_sentence else '\n'
+        if self.input_lines is None:
+            portions = re.split(split_triggers, self.input_text)
+        else:
+            portions = (portion for line in self.input_lines
+                        for portion in re.split(split_triggers, line.rstrip("\n")))
+        for portion in portions:
+            if len(portion) > 0:
+                yield portion
+
+    def iter_annotated_sentences(self):
+        """
+        Yields (sentence, pinyins) for the non-empty portions of the annotated lines (see iter_sentences). Only hanzi
+        keep their pinyin, as in sentence_pinyins.
+        """
+        portion_pattern = re.compile('[^。\n]+' if self.new_line_for_sentence else '[^\n]+')
+        for line, line_pinyins in self.annotated_lines:
+            if line_pinyins is not None and len(line_pinyins) != len(line):
+                line_pinyins = None
+            for portion in portion_pattern.finditer(line):
+                pinyins = None
+                if line_pinyins is not None:
+                    pinyins = [pinyin if category == HANZI else " " for pinyin, category in
+                               zip(line_pinyins[portion.start():portion.end()], classify_string(portion.group()))]
+                yield portion.group(), pinyins
+
     def create_pdf(self):
         """
         Creates a pdf with Chinese characters and corresponding Pinyin
         """
-        if len(self.input_text) > 0:
-            self.place_headline_on_canvas()
+        self.render_start = time.perf_counter()
+        try:
+            sentences = self.iter_sentences() if self.annotated_lines is None else self.iter_annotated_sentences()
+            first_sentence = next(sentences, None)
+            if first_sentence is not None:
+                self.write_pdf(itertools.chain([first_sentence], sentences))
+            else:
+                logger.error(
+                    "Failure to create PDF file: No input text to create a pdf file from. You need to specify either a "
+                    "text file, or pass a text directly through the command line. Please see --help for help.")
+        finally:
+            if self.streamed_file:
+                self.streamed_file.close()
 
-            # Split the text into portions
-            split_triggers = '。|\n' if self.new_line_for_sentence else '\n'
-            sentences = re.split(split_triggers, self.input_text)
+    def annotate_in_parallel(self, sentences):
+        """
+        Yields (sentence, pinyins) for the sentences, in order. The pinyin is looked up by annotation_workers worker
+        processes, annotation_chunk_size sentences at a time, while this process lays out and draws the sentences
+        which are ready. At most two chunks per worker are in flight, so a streamed input is not read ahead further.
+        """
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.annotation_workers) as executor:
+            pending = deque()
+            while True:
+                while len(pending) < 2 * self.annotation_workers:
+                    chunk = list(itertools.islice(sentences, self.annotation_chunk_size))
+                    if not chunk:
+                        break
+                    pending.append((chunk, executor.submit(annotate_sentences, chunk, self.resolve_words)))
+                if not pending:
+                    break
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        metrics.record("pdf.parallel_annotation", time.perf_counter() - start)
 
-            # Write text to Canvas
-            for sentence in sentences:
-                self.place_sentence_on_canvas(sentence)
+    def write_pdf(self, sentences):
+        """
+        Lays out the sentences one by one onto the pdf canvas and saves the pdf file. Finished pages are handed over
+        to reportlab as soon as they are full, so only the current sentence is kept as Python objects. With more
+        than one annotation worker, the pinyin of the sentences is looked up in parallel ahead of the layout. With
+        annotated lines, the sentences come as (sentence, pinyins) already.
+        """
+        self.place_headline_on_canvas()
 
-            # Save pdf file
-            self.canvas.save()
-            print(f"\nSuccess! Text has been written to '{self.output_file}'.\n")
+        # Write text to Canvas
+        if self.annotated_lines is not None:
+            annotated_sentences = sentences
+        elif self.annotation_workers > 1:
+            annotated_sentences = self.annotate_in_parallel(sentences)
         else:
-            print(
-                "Failure to create PDF file: No input text to create a pdf file from. You need to specify either a "
-                "text file, or pass a text directly through the command line. Please see --help for help.\n")
+            annotated_sentences = ((sentence, None) for sentence in sentences)
+        for sentence, pinyins in annotated_sentences:
+            self.place_sentence_on_canvas(sentence, pinyins)
+
+        # Save pdf file. Streams are encoded while saving, so the ASCII85 setting only needs to be applied here
+        use_ascii85 = rl_config.useA85
+        rl_config.useA85 = int(OUTPUT_PROFILES[self.output_profile]["ascii85"])
+        try:
+            with metrics.timed("pdf.save"):
+                self.canvas.save()
+        finally:
+            rl_config.useA85 = use_ascii85
+        self.render_seconds = time.perf_counter() - self.render_start
+        self.output_size = os.path.getsize(self.output_file)
+        laid_out, reused = self.layout_counts["laid out"], self.layout_counts["reused"]
+        pages = self.canvas.getPageNumber() - 1
+        metrics.record("pdf.render", self.render_seconds)
+        metrics.record("pdf.layout", self.layout_seconds)
+        metrics.count("pdf.sentences_laid_out", laid_out)
+        metrics.count("pdf.sentences_reused", reused)
+        metrics.count("pdf.pages", pages)
+        metrics.gauge("pdf.sentences_per_second", (laid_out + reused) / self.render_seconds)
+        metrics.gauge("pdf.pages_per_second", pages / self.render_seconds)
+        metrics.add_source("pdf.annotation_cache", self.annotation_cache.stats)
+        if self.layout_cache is not None:
+            metrics.add_source("pdf.layout_cache", self.layout_cache.stats)
+
+        logger.info(f"Success! Text has been written to '{self.output_file}'.")
+        logger.info(f"Output profile '{self.output_profile}': {self.output_size / 1024:.1f} KB, {pages} pages, "
+                    f"rendered in {self.render_seconds:.2f}s.")
+        if self.annotation_workers > 1:
+            logger.info(f"Pinyin looked up by {self.annotation_workers} annotation workers, "
+                        f"{self.annotation_chunk_size} sentences at a time.")
+        else:
+            stats = self.annotation_cache.stats()
+            logger.info(f"Pinyin cache: {stats['hits']} hits, {stats['misses']} misses "
+                        f"(hit rate {stats['hit_rate']:.1%}).")
+        logger.info(f"Layout: {laid_out} sentences laid out, {reused} reused from the layout cache, "
+                    f"{self.layout_seconds:.3f}s spent on layout.")
+        if laid_out > 0 and reused > 0:
+            # estimated from the average time it took to lay out a sentence in this run
+            logger.info(f"The layout cache saved about {self.layout_seconds / laid_out * reused:.3f}s.")
 
 
 def create_pdf_from_commandline():
@@ -205,11 +517,79 @@ def create_pdf_from_commandline():
     parser.add_argument('--new_line_for_sentence', type=bool, default=False,
                         help='True if you want a new line for each sentence')
     parser.add_argument('--large_text', type=bool, default=False, help='True if you want extra large text')
+    parser.add_argument('--segment_words', type=bool, default=False,
+                        help='True if words should not be broken across lines (loads the dictionary)')
+    parser.add_argument('--stream', type=bool, default=False,
+                        help='True to stream the input file line by line, keeping memory bounded for very large texts')
+    parser.add_argument('--output_profile', type=str, default='default', choices=sorted(OUTPUT_PROFILES),
+                        help="'compact' for the smallest files, 'fast' for the fastest rendering")
+    parser.add_argument('--in_process', type=bool, default=False,
+                        help='True to always create the PDF in this process, even if an annotation server is running')
+    parser.add_argument('--batch_input', type=str, default=None,
+                        help='Batch mode: a directory of .txt files, a glob pattern, or a manifest file listing one '
+                             'text file per line. Each text is rendered to its own PDF')
+    parser.add_argument('--output_dir', type=str, default='.', help='Batch mode: directory for the output PDFs')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Batch mode: number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', type=bool, default=False,
+                        help='Batch mode: True to re-render PDFs which are already up to date')
+    parser.add_argument('--annotation_workers', type=int, default=1,
+                        help='Number of processes looking up the pinyin in parallel, for large texts (default: 1)')
+    parser.add_argument('--annotation_chunk_size', type=int, default=64,
+                        help='Number of sentences handed to an annotation worker at once (default: 64)')
+    parser.add_argument('--log_level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='DEBUG also logs every sentence; WARNING keeps large exports quiet')
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help='JSON file to write the timers and counters to (set HANZI_METRICS=off to disable them)')
 
     args = parser.parse_args()
+    if args.batch_input and args.annotation_workers > 1:
+        parser.error("--annotation_workers can not be combined with --batch_input, which already renders the texts "
+                     "in parallel (see --workers)")
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    try:
+        create_pdfs(args)
+    finally:
+        if args.metrics_file:
+            metrics.dump(args.metrics_file)
+
+
+def create_pdfs(args):
+    """Creates the pdf(s) requested on the command line"""
+
+    if args.batch_input:
+        from pdfBatch import create_pdfs_in_batch
+        create_pdfs_in_batch(args.batch_input, args.output_dir, workers=args.workers, force=args.force,
+                             new_line_for_sentence=args.new_line_for_sentence, large_text=args.large_text,
+                             output_profile=args.output_profile, segment_words=args.segment_words,
+                             stream=args.stream)
+        return
+
+    # Let a running annotation server create the pdf: it has the dictionary and the fonts loaded already
+    annotation_client = None if args.in_process else AnnotationClient.connect()
+    if annotation_client:
+        try:
+            result = annotation_client.create_pdf(args.input_file, args.output_file + ".pdf",
+                                                  input_text=args.input_text, headline=args.headline,
+                                                  new_line_for_sentence=args.new_line_for_sentence,
+                                                  large_text=args.large_text, segment_words=args.segment_words,
+                                                  stream=args.stream, output_profile=args.output_profile)
+            logger.info(f"Success! The annotation server has written the text to '{result['output_file']}' "
+                        f"({result['size'] / 1024:.1f} KB, rendered in {result['seconds']:.2f}s).")
+            return
+        except AnnotationServerError as e:
+            logger.error(f"Failure to create PDF file: {e}")
+            return
+        except OSError:
+            logger.warning("Lost the connection to the annotation server, creating the PDF in this process.")
 
+    dictionary = Dict() if args.segment_words else None
+    segmenter = Segmenter(dictionary.words) if dictionary else None
+    annotation_cache = AnnotationCache(resolver=PinyinResolver(dictionary)) if dictionary else None
     pdf_maker = PdfCreator(args.input_file, args.input_text, args.headline, args.output_file + ".pdf",
-                           args.new_line_for_sentence, args.large_text)
+                           args.new_line_for_sentence, args.large_text, segmenter, annotation_cache, stream=args.stream,
+                           output_profile=args.output_profile, annotation_workers=args.annotation_workers,
+                           annotation_chunk_size=args.annotation_chunk_size)
     pdf_maker.create_pdf()
 
 
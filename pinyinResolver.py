@@ -0,0 +1,91 @@
+import re
+import unicodedata
+
+from charClassifier import is_hanzi
+from dict import syllables
+from lruCache import LruCache
+
+# Combining tone marks of the tones 1 to 4 (macron, acute, caron, grave); the neutral tone 5 has none
+TONE_MARKS = ["", "\u0304", "\u0301", "\u030c", "\u0300", ""]
+NUMBERED_SYLLABLE = re.compile(r"^([a-zü]+)([1-5])$")
+# Numbered syllable -> marked syllable; there are only about 1500 different syllables
+marked_syllables = {}
+
+
+def marked_pinyin(syllable):
+    """Converts a numbered pinyin syllable ('xing2', 'lv4', 'lu:4', 'le5') into pinyin with a tone mark ('xíng', 'lǜ',
+    'le')"""
+    marked = marked_syllables.get(syllable)
+    if marked is None:
+        marked = marked_syllables[syllable] = mark_tone(syllable)
+    return marked
+
+
+def mark_tone(syllable):
+    """Places the tone mark of a numbered syllable: onto a or e, onto the o of ou, and otherwise onto the last vowel"""
+    syllable = syllable.lower().replace("u:", "ü").replace("v", "ü")
+    match = NUMBERED_SYLLABLE.match(syllable)
+    if match is None:
+        return syllable
+    letters, tone = match.group(1), int(match.group(2))
+    position = max(letters.find("a"), letters.find("e"))
+    if position < 0:
+        position = letters.find("ou")
+    if position < 0:
+        position = max(letters.rfind(vowel) for vowel in "iouü")
+    if position < 0:
+        return letters
+    return unicodedata.normalize("NFC", letters[:position + 1] + TONE_MARKS[tone] + letters[position + 1:])
+
+
+def default_pinyin(text):
+    """Returns the most common reading of every hanzi of a text, without looking at their context. Other characters
+    are kept as they are."""
+    # the pinyin library takes a while to import, so it is only imported once the first pinyin is needed
+    import pinyin as pinyin_library
+    return "".join(marked_pinyin(pinyin_library.get(char, format="numerical")) if is_hanzi(char) else char
+                   for char in text)
+
+
+class PinyinResolver:
+    """
+    Resolves the reading of polyphones (hanzi with several readings, e.g. 行 xíng / háng) from their context: a
+    dictionary word containing a polyphone is read as given by the pinyin of its best dictionary entry
+    (银行 yínháng, 行走 xíngzǒu). The polyphone table is precomputed with the dictionary index, so words without a
+    polyphone are never looked up, and the readings of looked up words are kept in a bounded LRU memo. Thread safe.
+    """
+
+    def __init__(self, dictionary, capacity=20000):
+        """
+        Parameters
+        ----------
+        dictionary : Dict
+            Provides the entries of the words and the polyphone table of its index
+        capacity : int, optional
+            Maximum number of memoized words (default is 20000)
+        """
+        self.dictionary = dictionary
+        self.polyphones = frozenset(dictionary.words.polyphones)
+        self.memo = LruCache(capacity)
+
+    def word_readings(self, word):
+        """Returns the reading of every character of a dictionary word containing a polyphone (characters other than
+        hanzi are kept as they are), or None if the word's characters can be read without their context"""
+        if len(word) < 2 or self.polyphones.isdisjoint(word):
+            self.memo.skip()
+            return None
+        return self.memo.get(word, self.look_up_readings)
+
+    def look_up_readings(self, word):
+        """Returns the readings of a word from its best dictionary entry with one syllable per character, bypassing
+        the memo"""
+        for entry in self.dictionary.lookup(word):
+            entry_syllables = syllables(entry)
+            if entry_syllables:
+                return tuple(marked_pinyin(syllable) if is_hanzi(char) else char
+                             for char, syllable in zip(word, entry_syllables))
+        return None
+
+    def stats(self):
+        """Returns the memo's hit/miss counters and size, and how many words needed no lookup at all"""
+        return dict(self.memo.stats(), polyphones=len(self.polyphones))
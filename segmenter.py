@@ -0,0 +1,48 @@
+class Segmenter:
+    """
+    Splits Chinese text into dictionary words using forward longest matching.
+
+    The dictionary's headwords are stored as a flattened trie: a single dict mapping every prefix of every headword
+    to True (the prefix is a complete headword) or False (it is only the beginning of one). Walking the trie from a
+    position in the text is a sequence of dict lookups, which stops as soon as the text leaves the trie. Segmenting a
+    text is therefore linear in its length (bounded by the longest headword per position).
+    """
+
+    def __init__(self, words):
+        """
+        Parameters
+        ----------
+        words : iterable of str
+            The dictionary headwords, e.g. Dict.words
+        """
+        self.prefixes = {}
+        self.max_word_length = 0
+        for word in words:
+            for i in range(1, len(word)):
+                self.prefixes.setdefault(word[:i], False)
+            self.prefixes[word] = True
+            self.max_word_length = max(self.max_word_length, len(word))
+
+    def longest_match(self, text, start):
+        """Returns the end position of the longest headword starting at text[start]. Characters which do not start
+        any headword are returned as a word of their own."""
+        prefixes = self.prefixes
+        end = start + 1
+        stop = min(len(text), start + self.max_word_length)
+        for i in range(start + 1, stop + 1):
+            is_word = prefixes.get(text[start:i])
+            if is_word is None:
+                break
+            if is_word:
+                end = i
+        return end
+
+    def segment(self, text):
+        """Splits the text into a list of words. Joining the list returns the original text."""
+        words = []
+        start = 0
+        while start < len(text):
+            end = self.longest_match(text, start)
+            words.append(text[start:end])
+            start = end
+        return words
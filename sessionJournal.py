@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from array import array
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SESSION_JOURNAL = "res/session.journal"
+OFFSET = struct.Struct("<Q")
+
+
+class SessionJournal:
+    """
+    Append-only journal of the lines archived in a session, so the session survives a crash and a restarted
+    interpreter resumes it. A session which is ended cleanly (end_session) is kept under a timestamped name instead,
+    so only a journal left behind by a crash is resumed. Each line is one JSON record (text and pinyin, as shown in
+    the archive, and the pinyin of every character for the pdf export) terminated by a line break. The index file next
+    to it (journal path + ".idx") holds the start offset of every record as uint64, so resuming only reads the index,
+    and any range of lines is read with a single seek.
+
+    Records are written through to the operating system immediately, which is enough to survive a crash of the
+    interpreter; fsync (needed to survive a power loss) is batched, at most once per sync_interval seconds.
+    """
+
+    def __init__(self, path=SESSION_JOURNAL, sync_interval=1.0):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            The journal file (default is res/session.journal)
+        sync_interval : float, optional
+            Minimum number of seconds between two fsyncs (default is 1.0)
+        """
+        self.path = path
+        self.index_path = path + ".idx"
+        self.sync_interval = sync_interval
+        self.open()
+
+    def open(self):
+        self.offsets = array("Q")
+        self.end = self.recover()
+        self.journal = open(self.path, "ab")
+        self.index = open(self.index_path, "ab")
+        self.last_sync = time.monotonic()
+        self.unsynced = False
+
+    def recover(self):
+        """
+        Loads the index and makes it consistent with the journal after a crash: index entries beyond the journal are
+        dropped, records missing from the index are added, and a partially written last record is cut off. Only the
+        records after the last indexed one are read. Returns the end of the last complete record.
+        """
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            self.offsets.frombytes(data[:len(data) - len(data) % OFFSET.size])
+            if sys.byteorder != "little":
+                self.offsets.byteswap()
+        except FileNotFoundError:
+            pass
+        indexed = len(self.offsets)
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        while len(self.offsets) > 0 and self.offsets[-1] >= size:
+            self.offsets.pop()
+
+        # Check the last indexed record and read everything behind it
+        end = self.offsets.pop() if len(self.offsets) > 0 else 0
+        if size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(end)
+                for record in f:
+                    try:
+                        json.loads(record)
+                    except ValueError:
+                        break
+                    if not record.endswith(b"\n"):
+                        break
+                    self.offsets.append(end)
+                    end += len(record)
+        if end < size:
+            logger.warning(f"Session journal: dropping an incomplete record at the end of '{self.path}'.")
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        if len(self.offsets) != indexed or end < size:
+            self.write_index()
+        return end
+
+    def write_index(self):
+        offsets = array("Q", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        with open(self.index_path + ".tmp", "wb") as f:
+            f.write(offsets.tobytes())
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def append(self, text, pinyin, pinyins=None):
+        """Writes a line to the journal and returns its number"""
+        record = {"text": text, "pinyin": pinyin}
+        if pinyins is not None:
+            record["pinyins"] = pinyins
+        record = json.dumps(record, ensure_ascii=False).encode("utf8") + b"\n"
+        # the record is on its way to disk before the index points to it
+        self.journal.write(record)
+        self.journal.flush()
+        self.index.write(OFFSET.pack(self.end))
+        self.index.flush()
+        self.offsets.append(self.end)
+        self.end += len(record)
+        self.unsynced = True
+        metrics.count("journal.records")
+        if time.monotonic() - self.last_sync >= self.sync_interval:
+            with metrics.timed("journal.fsync"):
+                self.sync()
+        return len(self.offsets) - 1
+
+    def sync(self):
+        """Forces the records written so far onto the disk"""
+        if self.unsynced:
+            os.fsync(self.journal.fileno())
+            os.fsync(self.index.fileno())
+            self.unsynced = False
+        self.last_sync = time.monotonic()
+
+    def records(self, first=0, last=None):
+        """Yields the records of the lines first to last (exclusive) as dicts. Each call reads through its own file
+        handle, so several generators can be iterated at the same time."""
+        last = len(self) if last is None else last
+        if first >= last:
+            return
+        with open(self.path, "rb") as reader:
+            reader.seek(self.offsets[first])
+            for _ in range(first, last):
+                yield json.loads(reader.readline())
+
+    def read(self, first=0, last=None):
+        """Yields (text, pinyin) of the lines first to last (exclusive)"""
+        for record in self.records(first, last):
+            yield record["text"], record["pinyin"]
+
+    def read_pinyins(self, first=0, last=None):
+        """Yields (text, pinyin of every character) of the lines first to last (exclusive). The pinyin is None for
+        lines journaled without it."""
+        for record in self.records(first, last):
+            yield record["text"], record.get("pinyins")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        self.sync()
+        for f in (self.journal, self.index):
+            f.close()
+
+    def end_session(self):
+        """Closes the journal and ends the session cleanly: the journal and its index are kept under a name with the
+        current time, so the next start does not resume them. Returns the new name of the old journal, or None if it
+        was empty."""
+        self.close()
+        if len(self.offsets) == 0:
+            return None
+        root, extension = os.path.splitext(self.path)
+        old_path = f"{root}-{time.strftime('%Y%m%d-%H%M%S')}{extension}"
+        os.replace(self.path, old_path)
+        os.replace(self.index_path, old_path + ".idx")
+        return old_path
+
+    def rotate(self):
+        """Ends the session and starts a new, empty journal. Returns the new name of the old journal, or None if it
+        was empty."""
+        old_path = self.end_session()
+        self.open()
+        return old_path
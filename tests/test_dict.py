@@ -0,0 +1,124 @@
+"""
+Tests of the binary dictionary index on a small fixture dictionary: compiling and looking up entries, the reverse
+lookup through the pinyin and keyword tables, the polyphone table, and the detection of a stale index.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dict import Dict, DictIndex, INDEX_MAGIC, compile_index, index_is_stale
+
+FIXTURE = """# CEDICT fixture
+銀行 银行 [yin2 hang2] /bank/CL:家[jia1]/
+行 行 [hang2] /row/line/profession/
+行 行 [xing2] /to walk/to go/capable/
+行走 行走 [xing2 zou3] /to walk/
+中國 中国 [Zhong1 guo2] /China/
+鐘 钟 [Zhong1] /surname Zhong/
+鐘 钟 [zhong1] /clock/bell/
+圖書館 图书馆 [tu2 shu1 guan3] /library/
+書 书 [shu1] /book/letter/
+女 女 [nu:3] /female/woman/
+"""
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "cedict.itp"
+    path.write_text(FIXTURE, encoding="utf8")
+    return str(path)
+
+
+@pytest.fixture
+def dictionary(source, tmp_path):
+    dictionary = Dict(source, str(tmp_path / "cedict.idx"))
+    yield dictionary
+    dictionary.words.close()
+
+
+def test_compile_counts_every_entry(source, tmp_path):
+    assert compile_index(source, str(tmp_path / "cedict.idx")) == 10
+
+
+def test_lookup_round_trip(dictionary):
+    words = dictionary.words
+    # 13 headwords: the simplified and the traditional form of each word, where they differ
+    assert len(words) == 13
+    assert "银行" in words and "銀行" in words and "图书馆" in words
+    assert "不在" not in words and 42 not in words
+    assert words["书"] == "\nbook\nletter"
+    assert dictionary.translate("銀行") == "\nbank\nCL:家[jia1]"
+    assert dictionary.translate("不在") == "_"
+    with pytest.raises(KeyError):
+        words["不在"]
+    entry, = dictionary.lookup("圖書館")
+    assert (entry.traditional, entry.simplified, entry.pinyin, entry.senses) == \
+           ("圖書館", "图书馆", "tu2 shu1 guan3", ("library",))
+
+
+def test_entries_best_match_first(dictionary):
+    # the most common reading of 行 first, and common words before proper nouns
+    assert [entry.pinyin for entry in dictionary.lookup("行")] == ["xing2", "hang2"]
+    assert [entry.pinyin for entry in dictionary.lookup("钟")] == ["zhong1", "Zhong1"]
+    assert dictionary.words["行"].startswith("\nto walk\n")
+
+
+def test_reverse_lookup_by_pinyin(dictionary):
+    for query in ("zhong1guo2", "Zhong guo", "zhōngguó", "zhongguo"):
+        assert [entry.simplified for entry in dictionary.reverse_lookup(query)] == ["中国"]
+    assert [entry.simplified for entry in dictionary.reverse_lookup("nü3")] == ["女"]
+    assert [entry.pinyin for entry in dictionary.reverse_lookup("zhong")] == ["zhong1", "Zhong1"]
+
+
+def test_reverse_lookup_by_keyword(dictionary):
+    assert [entry.simplified for entry in dictionary.reverse_lookup("library")] == ["图书馆"]
+    # every keyword must match; stop words are ignored
+    assert [entry.simplified for entry in dictionary.reverse_lookup("to walk")] == ["行", "行走"]
+    assert [entry.simplified for entry in dictionary.reverse_lookup("the Bell")] == ["钟"]
+    assert dictionary.reverse_lookup("walk book") == []
+    assert dictionary.reverse_lookup("the") == []
+
+
+def test_polyphones(dictionary):
+    polyphones = set(dictionary.words.polyphones)
+    assert "行" in polyphones
+    # 钟 is read zhong1 in both entries, 书 has a single reading
+    assert "钟" not in polyphones and "书" not in polyphones
+    assert [dictionary.words.entry(number).pinyin for number in dictionary.words.polyphones.numbers("行")] == \
+           ["xing2", "hang2"]
+
+
+def test_stale_index(source, tmp_path):
+    index = str(tmp_path / "cedict.idx")
+    assert index_is_stale(source, index)
+    compile_index(source, index)
+    assert not index_is_stale(source, index)
+    # the source has changed since the index was compiled
+    compiled = os.path.getmtime(source) - 10
+    os.utime(index, (compiled, compiled))
+    assert index_is_stale(source, index)
+    compile_index(source, index)
+    assert not index_is_stale(source, index)
+    # an index in an older format
+    with open(index, "r+b") as f:
+        f.write(b"CEDIDX02")
+    assert index_is_stale(source, index)
+    with pytest.raises(ValueError):
+        DictIndex(index)
+
+
+def test_stale_index_is_recompiled(source, tmp_path):
+    index = str(tmp_path / "cedict.idx")
+    with open(index, "wb") as f:
+        f.write(b"CEDIDX02" + bytes(100))
+    dictionary = Dict(source, index)
+    assert dictionary.translate("书") == "\nbook\nletter"
+    dictionary.words.close()
+    with open(index, "rb") as f:
+        assert f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
@@ -0,0 +1,86 @@
+"""
+Tests of the session journal: resuming, crash recovery of a partially written last record, ending a session and
+reading several ranges at the same time.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessionJournal import SessionJournal
+
+LINES = [("你好", "nǐ hǎo ", ["nǐ", "hǎo"]),
+         ("银行", "yín háng ", ["yín", "háng"]),
+         ("hi 好", "hi hǎo ", None)]
+
+
+def write_journal(path):
+    journal = SessionJournal(path)
+    for text, pinyin, pinyins in LINES:
+        journal.append(text, pinyin, pinyins)
+    journal.close()
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_journal(path)
+    journal = SessionJournal(path)
+    assert len(journal) == len(LINES)
+    assert list(journal.read()) == [(text, pinyin) for text, pinyin, _ in LINES]
+    assert list(journal.read_pinyins(1)) == [(text, pinyins) for text, _, pinyins in LINES[1:]]
+    journal.close()
+
+
+def test_recover_truncated_last_record(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_journal(path)
+    with open(path, "rb") as f:
+        size = len(f.read())
+    # a crash in the middle of writing the last record
+    with open(path, "r+b") as f:
+        f.truncate(size - 5)
+    journal = SessionJournal(path)
+    assert list(journal.read()) == [(text, pinyin) for text, pinyin, _ in LINES[:-1]]
+    # the incomplete record has been cut off, so the next one is appended after the last complete record
+    journal.append("再见", "zài jiàn ", ["zài", "jiàn"])
+    journal.close()
+    journal = SessionJournal(path)
+    assert [text for text, _ in journal.read()] == ["你好", "银行", "再见"]
+    journal.close()
+
+
+def test_recover_missing_index_entries(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_journal(path)
+    # a crash after writing the records, before their index entries
+    with open(path + ".idx", "r+b") as f:
+        f.truncate(8)
+    journal = SessionJournal(path)
+    assert len(journal) == len(LINES)
+    assert list(journal.read(2)) == [(LINES[2][0], LINES[2][1])]
+    journal.close()
+
+
+def test_concurrent_readers(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_journal(path)
+    journal = SessionJournal(path)
+    export = journal.read_pinyins()
+    assert next(export)[0] == "你好"
+    assert list(journal.read(2, 3)) == [(LINES[2][0], LINES[2][1])]
+    assert [text for text, _ in export] == ["银行", "hi 好"]
+    journal.close()
+
+
+def test_end_keeps_the_session_without_resuming_it(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_journal(path)
+    journal = SessionJournal(path)
+    old_path = journal.end_session()
+    assert os.path.exists(old_path) and os.path.exists(old_path + ".idx")
+    journal = SessionJournal(path)
+    assert len(journal) == 0
+    assert journal.end_session() is None